@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Client, Trainer, Training, User, Membership, MembershipType, Attendance, Payment, Hall
+from .models import Client, Trainer, Training, User, Membership, MembershipType, Attendance, Payment, Hall, DailyRevenue
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
@@ -17,4 +17,5 @@ admin.site.register(Membership)
 admin.site.register(MembershipType)
 admin.site.register(Payment)
 admin.site.register(Attendance)
-admin.site.register(Hall)
\ No newline at end of file
+admin.site.register(Hall)
+admin.site.register(DailyRevenue)
\ No newline at end of file
@@ -7,6 +7,7 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
+        from . import signals  # noqa: F401
         from .models import User, Trainer
 
         try:
@@ -0,0 +1,104 @@
+"""Чтение с реплики: отчёты и GET-запросы API читают из DATABASE_REPLICA,
+запись и всё, что после неё, — из default.
+
+Куда читать, решает ReplicaRoutingMiddleware на каждый запрос. Запись в
+ходе запроса переключает его остальные чтения на default, а пользователь
+ещё DATABASE_PRIMARY_PIN_SECONDS читает из default, чтобы видеть свои
+изменения, пока они не дошли до реплики. Пометка хранится в кэше Django
+по id пользователя и проверяется после аутентификации (route_user); при
+нескольких веб-процессах CACHES должен быть общим (Redis, Memcached),
+иначе пометку видит только процесс, выполнивший запись. Вне запросов
+(команды, shell) маршрутизации нет и всё идёт в default.
+
+Локально реплику можно изобразить второй базой SQLite:
+
+    DATABASES = {
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'db.sqlite3'},
+        'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3'},
+    }
+
+и скопировать db.sqlite3 в replica.sqlite3 (или migrate --database replica).
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Routing:
+    """Откуда читает текущий запрос, чей он и была ли в нём запись"""
+
+    def __init__(self, database):
+        self.database = database
+        self.user_id = None
+        self.wrote = False
+
+
+# Контекст переносится sync_to_async в поток ORM и в пул отчётов через reading_from
+current_routing = ContextVar('current_routing', default=None)
+
+
+def replica_alias():
+    """Алиас реплики, если она описана в DATABASES"""
+    alias = settings.DATABASE_REPLICA
+    return alias if alias in settings.DATABASES else None
+
+
+def read_database():
+    """База для чтений текущего запроса; None — маршрутизации нет"""
+    routing = current_routing.get()
+    return routing.database if routing else None
+
+
+def _pin_key(user_id):
+    return f'db_primary:{user_id}'
+
+
+def route_user(user_id):
+    """Запрос аутентифицирован как user_id: после недавней записи он читает из default"""
+    routing = current_routing.get()
+    if routing is None:
+        return
+    routing.user_id = user_id
+    if routing.database is not None and cache.get(_pin_key(user_id)):
+        routing.database = None
+
+
+def pin_to_primary(routing):
+    """После записи пользователь DATABASE_PRIMARY_PIN_SECONDS читает из default"""
+    if routing.wrote and routing.user_id is not None:
+        cache.set(_pin_key(routing.user_id), True, settings.DATABASE_PRIMARY_PIN_SECONDS)
+
+
+@contextmanager
+def reading_from(database):
+    """Читать внутри блока из database (None — из default)"""
+    token = current_routing.set(Routing(database) if database else None)
+    try:
+        yield
+    finally:
+        current_routing.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None:
+            return None
+        return routing.database or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            # Дальше в этом запросе читаем своё же из default
+            routing.database = None
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, settings.DATABASE_REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Client, DataVersion
+from .serializers import ClientImportSerializer
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def read_records(stream, fmt):
+    """Построчно читает бинарный поток, отдаёт (номер строки, dict или ошибка разбора).
+
+    Если дальше файл прочитать нельзя (не UTF-8, битый CSV), последней отдаётся
+    ошибка с номером строки, на которой чтение остановилось.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f'Неизвестный формат: {fmt}')
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    line_num = 0
+    try:
+        if fmt == 'csv':
+            reader = csv.DictReader(text)
+            for record in reader:
+                line_num = reader.line_num
+                yield line_num, record
+        else:
+            for line_num, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield line_num, ValueError(f'Некорректный JSON: {e}')
+                    continue
+                if not isinstance(record, dict):
+                    yield line_num, ValueError('Ожидается JSON-объект')
+                    continue
+                yield line_num, record
+    except (UnicodeDecodeError, csv.Error) as e:
+        yield line_num + 1, ValueError(f'Файл не читается дальше, импорт остановлен: {e}')
+
+
+def import_clients(stream, fmt, batch_size=1000, max_errors=1000):
+    """Потоковый импорт клиентов из CSV/JSONL пачками по batch_size строк.
+
+    Каждая пачка проверяется сериализатором, телефоны сверяются с базой одним
+    запросом, затем вставляются одним bulk_create в своей транзакции. Ошибки
+    отдельных строк собираются в отчёт (не больше max_errors) и не прерывают импорт.
+    """
+    result = {'created': 0, 'errors': [], 'error_count': 0}
+
+    def error(line_num, errors):
+        result['error_count'] += 1
+        if len(result['errors']) < max_errors:
+            result['errors'].append({'line': line_num, 'errors': errors})
+
+    # Один экземпляр сериализатора: поля строятся один раз, а не для каждой строки
+    validator = ClientImportSerializer()
+    records = read_records(stream, fmt)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+
+        valid = []
+        phones = set()
+        for line_num, record in batch:
+            if isinstance(record, Exception):
+                error(line_num, str(record))
+                continue
+            try:
+                data = validator.run_validation(record)
+            except ValidationError as e:
+                error(line_num, e.detail)
+                continue
+            if data['phone'] in phones:
+                error(line_num, {'phone': ['Телефон повторяется в файле']})
+                continue
+            phones.add(data['phone'])
+            valid.append((line_num, data))
+
+        existing = set(Client.objects.filter(phone__in=phones).values_list('phone', flat=True))
+        clients = []
+        for line_num, data in valid:
+            if data['phone'] in existing:
+                error(line_num, {'phone': ['Клиент с таким телефоном уже существует']})
+            else:
+                clients.append((line_num, Client(**data)))
+
+        result['created'] += _insert(clients, error)
+
+    if result['created']:
+        # bulk_create не отправляет post_save, версию данных отчётов сдвигаем сами
+        DataVersion.bump('client')
+    return result
+
+
+def _insert(clients, error):
+    if not clients:
+        return 0
+    try:
+        with transaction.atomic():
+            Client.objects.bulk_create([client for _, client in clients])
+        return len(clients)
+    except IntegrityError:
+        pass
+
+    # Кто-то успел занять телефон между проверкой и вставкой: пачка построчно
+    created = 0
+    for line_num, client in clients:
+        try:
+            with transaction.atomic():
+                client.save()
+            created += 1
+        except IntegrityError as e:
+            error(line_num, str(e))
+    return created
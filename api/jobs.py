@@ -0,0 +1,234 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .db_router import read_database, reading_from, replica_alias
+from .middleware import QueryRecorder, current_recorder
+from .models import ReportJob
+from .worker import init_worker
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending_renders = threading.BoundedSemaphore(settings.REPORT_RENDER_MAX_PENDING)
+# Задания, отправленные в пул этим процессом. Считать очередь по БД нельзя:
+# задания, оставшиеся queued/running после перезапуска, заняли бы её до очистки.
+_queued_jobs = threading.BoundedSemaphore(settings.REPORT_JOBS_MAX_QUEUE)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class PoolUnavailable(Exception):
+    """Пул не принял задание даже после пересоздания"""
+
+
+def get_executor():
+    """Пул процессов рендеринга, создаётся при первом задании.
+
+    Используется spawn, а не fork: дочерний процесс заново поднимает Django
+    и не наследует соединения с БД и потоки веб-сервера. Пул, у которого
+    упал процесс (OOM, segfault), больше не принимает заданий и создаётся заново.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None and getattr(_executor, '_broken', False):
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.REPORT_JOBS_MAX_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            )
+        return _executor
+
+
+def _drop_executor(broken):
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(fn, *args):
+    """Отправляет fn в пул. Если пул сломан, он пересоздаётся и попытка повторяется один раз.
+
+    PoolUnavailable, если и новый пул не принял задание.
+    """
+    executor = get_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        _drop_executor(executor)
+    try:
+        return get_executor().submit(fn, *args)
+    except BrokenProcessPool as e:
+        raise PoolUnavailable(f'Пул построения отчётов недоступен: {e}') from e
+
+
+def enqueue_report(job):
+    """Ставит сохранённое задание в пул.
+
+    QueueFull, если очередь этого процесса заполнена; PoolUnavailable, если
+    пул не принял задание, — тогда задание помечается failed.
+    """
+    cleanup_report_jobs()
+
+    if not _queued_jobs.acquire(blocking=False):
+        job.delete()
+        raise QueueFull('Очередь отчётов заполнена, повторите позже')
+
+    try:
+        future = submit(run_report_job, str(job.pk))
+    except BaseException as e:
+        _queued_jobs.release()
+        if isinstance(e, PoolUnavailable):
+            ReportJob.objects.filter(pk=job.pk).update(status='failed', error=str(e), finished_at=timezone.now())
+        raise
+    future.add_done_callback(lambda f: _job_done(job.pk, f))
+
+
+def _job_done(job_id, future):
+    _queued_jobs.release()
+    _mark_crashed(job_id, future)
+
+
+def _mark_crashed(job_id, future):
+    # Исключение здесь означает падение самого процесса пула, а не ошибку отчёта
+    error = future.exception()
+    if error is not None:
+        ReportJob.objects.filter(pk=job_id, status__in=['queued', 'running']).update(
+            status='failed', error=str(error), finished_at=timezone.now()
+        )
+        close_old_connections()
+
+
+def run_report_job(job_id):
+    """Выполняется в процессе пула: строит отчёт и пишет его в REPORT_JOBS_DIR"""
+    from .reports import REPORTS, export_report
+
+    close_old_connections()
+    job = ReportJob.objects.get(pk=job_id)
+    ReportJob.objects.filter(pk=job.pk).update(status='running')
+
+    try:
+        fmt = job.params.get('format', 'pdf')
+        os.makedirs(settings.REPORT_JOBS_DIR, exist_ok=True)
+        path = os.path.join(settings.REPORT_JOBS_DIR, f'{job.pk}.{fmt}')
+        with reading_from(replica_alias()), open(path, 'wb') as output:
+            write_document(export_report(REPORTS[job.report](job.params), fmt), output)
+    except Exception as e:
+        ReportJob.objects.filter(pk=job.pk).update(status='failed', error=str(e), finished_at=timezone.now())
+    else:
+        ReportJob.objects.filter(pk=job.pk).update(status='done', file=path, finished_at=timezone.now())
+    finally:
+        close_old_connections()
+
+
+def write_document(document, output):
+    """Пишет результат export_report (файл или итератор байтов) в output"""
+    if hasattr(document, 'read'):
+        shutil.copyfileobj(document, output)
+    else:
+        output.writelines(document)
+
+
+def render_report_file(name, params, fmt, database=None):
+    """Выполняется в процессе пула: строит отчёт во временный файл.
+
+    database — откуда читать данные (api.db_router.read_database запроса).
+    Возвращает путь к файлу, время выборки данных, общее время построения
+    и QueryRecorder с SQL отчёта: запросы выполнялись здесь, а не в веб-процессе.
+    """
+    from .metrics import ReportTimer
+    from .reports import REPORTS, export_report
+
+    close_old_connections()
+    recorder = QueryRecorder(settings.SLOW_REQUEST_TOP_QUERIES)
+    token = current_recorder.set(recorder)
+    try:
+        with reading_from(database):
+            timer = ReportTimer()
+            report = REPORTS[name](params)
+            timer.collected()
+            document = export_report(report._replace(rows=timer.rows(report.rows)), fmt)
+            with tempfile.NamedTemporaryFile(suffix=f'.{fmt}', delete=False) as output:
+                write_document(document, output)
+        return output.name, timer.fetch, time.perf_counter() - timer.started, recorder
+    finally:
+        current_recorder.reset(token)
+        close_old_connections()
+
+
+class TemporaryReportFile(io.FileIO):
+    """Файл отчёта из пула, удаляется при закрытии (FileResponse закрывает его после отдачи)"""
+
+    def close(self):
+        super().close()
+        try:
+            os.remove(self.name)
+        except FileNotFoundError:
+            pass
+
+
+async def render_in_pool(name, params, fmt):
+    """Строит отчёт в пуле процессов, не занимая цикл событий и поток ORM.
+
+    Возвращает открытый TemporaryReportFile, время выборки и общее время.
+    Не больше REPORT_RENDER_MAX_PENDING отчётов на веб-процесс одновременно
+    ждут пула или строятся, сверх этого QueueFull. PoolUnavailable, если пул
+    не принял задание или процесс упал во время построения.
+    """
+    if not _pending_renders.acquire(blocking=False):
+        raise QueueFull('Слишком много отчётов строится одновременно, повторите позже')
+    try:
+        future = submit(render_report_file, name, params, fmt, read_database())
+        path, fetch, total, queries = await asyncio.wrap_future(future)
+    except BrokenProcessPool as e:
+        # Следующий get_executor создаст новый пул
+        raise PoolUnavailable(f'Процесс построения отчёта завершился аварийно: {e}') from e
+    finally:
+        _pending_renders.release()
+    # SQL отчёта входит в метрики и лог медленных запросов этого запроса
+    recorder = current_recorder.get()
+    if recorder is not None:
+        recorder.merge(queries)
+    return TemporaryReportFile(path), fetch, total
+
+
+def fail_stale_report_jobs():
+    """Помечает failed задания, не завершившиеся за REPORT_JOBS_TIMEOUT, возвращает их число.
+
+    Так заканчиваются задания, чей веб-процесс перезапустили или убили вместе с пулом.
+    """
+    return ReportJob.objects.filter(
+        status__in=['queued', 'running'],
+        created_at__lt=timezone.now() - settings.REPORT_JOBS_TIMEOUT,
+    ).update(status='failed', error='Задание не завершилось вовремя', finished_at=timezone.now())
+
+
+def cleanup_report_jobs():
+    """Помечает зависшие задания failed и удаляет задания старше REPORT_JOBS_TTL
+    вместе с файлами, возвращает число удалённых"""
+    fail_stale_report_jobs()
+    expired = ReportJob.objects.filter(created_at__lt=timezone.now() - settings.REPORT_JOBS_TTL)
+    for path in expired.exclude(file='').values_list('file', flat=True):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    deleted, _ = expired.delete()
+    return deleted
@@ -0,0 +1,139 @@
+import io
+import json
+import statistics
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client as HttpClient
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import Attendance, Client, Membership, Payment, Trainer, Training, User
+from api.report_cache import report_cache
+from api.urls import router, urlpatterns
+
+DATASET_MODELS = (Client, Trainer, Membership, Payment, Training, Attendance)
+
+
+def endpoints():
+    """GET-эндпоинты роутера: список, первая запись и GET-действия viewset'ов"""
+    for prefix, viewset, basename in router.registry:
+        model = viewset.queryset.model
+        pk = model.objects.order_by('pk').values_list('pk', flat=True).first()
+        if hasattr(viewset, 'list'):
+            yield f'{prefix}-list', reverse(f'{basename}-list')
+        if hasattr(viewset, 'retrieve') and pk is not None:
+            yield f'{prefix}-detail', reverse(f'{basename}-detail', args=[pk])
+        for extra in viewset.get_extra_actions():
+            if 'get' not in extra.mapping:
+                continue
+            if not extra.detail:
+                yield f'{prefix}-{extra.url_path}', reverse(f'{basename}-{extra.url_name}')
+            elif pk is not None:
+                yield f'{prefix}-{extra.url_path}', reverse(f'{basename}-{extra.url_name}', args=[pk])
+
+
+def report_endpoints():
+    for pattern in urlpatterns:
+        if str(pattern.pattern).startswith('reports/'):
+            yield pattern.name, reverse(pattern.name)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа и число SQL-запросов для эндпоинтов роутера и отчётов. '
+            'С --clients перед каждым замером база заполняется заново через seed_data')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+',
+                            help='Размеры данных: для каждого база очищается и заполняется seed_data')
+        parser.add_argument('--repeat', type=int, default=5, help='Запросов на эндпоинт')
+        parser.add_argument('--user', help='Имя пользователя для запросов (по умолчанию первый администратор)')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Не спрашивать подтверждение очистки базы')
+
+    def handle(self, *args, **options):
+        if options['clients'] and options['interactive']:
+            answer = input(f'Данные спортзала в базе "{connection.settings_dict["NAME"]}" будут удалены и '
+                           'сгенерированы заново. Введите "yes" для продолжения: ')
+            if answer != 'yes':
+                raise CommandError('Замер отменён')
+
+        setup_test_environment()
+        runs = []
+        for size in options['clients'] or [None]:
+            if size is not None:
+                self.stdout.write(f'Генерация данных: {size} клиентов')
+                call_command('seed_data', clients=size, clear=True, interactive=False, stdout=io.StringIO())
+
+            user = self.get_user(options['user'])
+            http = HttpClient(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            dataset = {model._meta.model_name: model.objects.count() for model in DATASET_MODELS}
+            self.stdout.write(', '.join(f'{name}={count}' for name, count in dataset.items()))
+
+            results = {}
+            for name, url in endpoints():
+                results[name] = self.measure(http, url, options['repeat'])
+            for name, url in report_endpoints():
+                # Меряем построение отчёта, а не выдачу из кэша
+                results[name] = self.measure(http, url, options['repeat'], before=report_cache.clear)
+
+            runs.append({'dataset': dataset, 'results': results})
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump({
+                    'commit': git_commit(),
+                    'created': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'repeat': options['repeat'],
+                    'runs': runs,
+                }, output, indent=2, ensure_ascii=False)
+
+    def get_user(self, username):
+        users = User.objects.filter(username=username) if username else User.objects.filter(role='admin').order_by('pk')
+        user = users.first()
+        if user is None:
+            raise CommandError('Нет пользователя для авторизации запросов')
+        return user
+
+    def measure(self, http, url, repeat, before=None):
+        timings = []
+        for _ in range(repeat):
+            if before:
+                before()
+            started = time.perf_counter()
+            response = http.get(url)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            timings.append(time.perf_counter() - started)
+
+        result = {
+            'url': url,
+            'status': response.status_code,
+            'median_ms': statistics.median(timings) * 1000,
+            'max_ms': max(timings) * 1000,
+            # Учёт RequestMetricsMiddleware: в нём и SQL отчётов, выполненный в пуле процессов
+            'queries': response.wsgi_request.query_recorder.count,
+            'db_ms': response.wsgi_request.query_recorder.duration * 1000,
+            'bytes': len(body),
+        }
+        self.stdout.write(
+            f"{url}: {result['status']}, {result['median_ms']:.1f} мс (макс. {result['max_ms']:.1f}), "
+            f"запросов: {result['queries']} ({result['db_ms']:.1f} мс), {result['bytes']} Б"
+        )
+        return result
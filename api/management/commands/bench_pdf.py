@@ -0,0 +1,56 @@
+import json
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.pdf import cm, stream_pdf_document
+
+HEADERS = ['Дата', 'Клиент', 'Тренировка', 'Тренер', 'Статус']
+COL_WIDTHS = [3 * cm, 4.5 * cm, 3.5 * cm, 3.5 * cm, 2.5 * cm]
+
+
+def synthetic_rows(count):
+    """Строки в формате отчёта о посещаемости, без обращения к БД"""
+    start = date(2026, 1, 1)
+    for index in range(count):
+        yield [
+            (start + timedelta(days=index % 365)).strftime('%d.%m.%Y 10:00'),
+            f'Клиентов Клиент {index}',
+            'Групповая',
+            'Тренеров Тренер',
+            'Посетил' if index % 3 else 'Отмена',
+        ]
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время вёрстки PDF-отчёта в зависимости от числа строк'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='Размеры отчёта в строках')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        results = {}
+        for count in options['rows']:
+            started = time.perf_counter()
+            output = stream_pdf_document(
+                title='ОТЧЁТ ПО ПОСЕЩАЕМОСТИ',
+                subtitle='Синтетические данные',
+                summary=[{'label': 'Всего записей', 'value': count}],
+                headers=HEADERS,
+                rows=synthetic_rows(count),
+                col_widths=COL_WIDTHS
+            )
+            elapsed = time.perf_counter() - started
+            size = output.seek(0, 2)
+            output.close()
+
+            results[count] = {'seconds': elapsed, 'ms_per_1000_rows': elapsed * 1e6 / count, 'bytes': size}
+            self.stdout.write(
+                f'{count} строк: {elapsed:.2f} с, {elapsed * 1e6 / count:.1f} мс на 1000 строк, {size // 1024} КБ'
+            )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump(results, output, indent=2)
@@ -0,0 +1,76 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import User
+
+# Выполняется в отдельном процессе, чтобы мерить холодный старт
+SCRIPT = '''
+import json, sys, time
+t0 = time.perf_counter()
+import django
+django.setup()
+t1 = time.perf_counter()
+import api.views
+t2 = time.perf_counter()
+result = {'setup': t1 - t0, 'import_views': t2 - t1}
+if len(sys.argv) > 1:
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from rest_framework_simplejwt.tokens import AccessToken
+    from api.models import User
+    setup_test_environment()
+    token = str(AccessToken.for_user(User.objects.get(pk=int(sys.argv[2]))))
+    t3 = time.perf_counter()
+    response = Client().get(sys.argv[1], HTTP_AUTHORIZATION='Bearer ' + token)
+    result['first_request'] = time.perf_counter() - t3
+    result['status'] = response.status_code
+result['reportlab_loaded'] = 'reportlab' in sys.modules
+print(json.dumps(result))
+'''
+
+SCENARIOS = {
+    'import': None,
+    'first_crud_request': '/api/halls/',
+    'first_report_request': '/api/reports/trainer_performance/',
+}
+
+
+class Command(BaseCommand):
+    help = 'Измеряет холодный старт: импорт api.views и время первого CRUD-запроса и первого отчёта'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Запусков на сценарий')
+        parser.add_argument('--user', help='Имя пользователя для запросов (по умолчанию первый)')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['user']).first() if options['user'] else User.objects.first()
+        if user is None:
+            raise CommandError('Нет пользователя для авторизации запросов')
+
+        results = {}
+        for name, url in SCENARIOS.items():
+            argv = [sys.executable, '-c', SCRIPT] + ([url, str(user.pk)] if url else [])
+            runs = []
+            for _ in range(options['repeat']):
+                output = subprocess.run(argv, capture_output=True, text=True, check=True, cwd=settings.BASE_DIR).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+
+            summary = {
+                key: statistics.median(run[key] for run in runs)
+                for key in ('setup', 'import_views', 'first_request') if key in runs[0]
+            }
+            summary['reportlab_loaded'] = runs[0]['reportlab_loaded']
+            results[name] = summary
+
+            timings = ', '.join(f'{key}={value * 1000:.1f} мс' for key, value in summary.items() if key != 'reportlab_loaded')
+            self.stdout.write(f"{name}: {timings}, reportlab={'да' if summary['reportlab_loaded'] else 'нет'}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump(results, output, indent=2)
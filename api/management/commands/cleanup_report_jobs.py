@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import cleanup_report_jobs, fail_stale_report_jobs
+
+
+class Command(BaseCommand):
+    help = ('Помечает failed зависшие задания отчётов (REPORT_JOBS_TIMEOUT), '
+            'удаляет устаревшие задания и их файлы (REPORT_JOBS_TTL)')
+
+    def handle(self, *args, **options):
+        failed = fail_stale_report_jobs()
+        deleted = cleanup_report_jobs()
+        self.stdout.write(self.style.SUCCESS(f'Прервано заданий: {failed}, удалено заданий: {deleted}'))
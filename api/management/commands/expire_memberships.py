@@ -0,0 +1,16 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from api.models import Membership
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Переводит просроченные абонементы в статус "Истёк" (запускать по расписанию, например раз в сутки)'
+
+    def handle(self, *args, **options):
+        expired = Membership.expire_overdue()
+        logger.info('Просроченных абонементов переведено в "Истёк": %s', expired)
+        self.stdout.write(self.style.SUCCESS(f'Истёкших абонементов: {expired}'))
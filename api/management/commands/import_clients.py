@@ -0,0 +1,31 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import IMPORT_FORMATS, import_clients
+
+
+class Command(BaseCommand):
+    help = 'Импортирует клиентов из CSV или JSONL файла пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу')
+        parser.add_argument('--format', dest='fmt', choices=IMPORT_FORMATS,
+                            help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['fmt'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in IMPORT_FORMATS:
+            raise CommandError(f'Не удалось определить формат файла {path}, укажите --format')
+
+        with open(path, 'rb') as stream:
+            result = import_clients(stream, fmt, batch_size=options['batch_size'])
+
+        for item in result['errors']:
+            self.stderr.write(f"Строка {item['line']}: {json.dumps(item['errors'], ensure_ascii=False)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано клиентов: {result['created']}, ошибок: {result['error_count']}"
+        ))
@@ -0,0 +1,121 @@
+import http.client
+import itertools
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import User
+from api.urls import router
+from api.views import BaseViewSet
+
+REPORT_URLS = ('revenue_report', 'attendance_report')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест запущенного сервера: задержка чтения списков (p50/p99) '
+            'без отчётов и пока параллельно строятся PDF-отчёты')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес запущенного сервера')
+        parser.add_argument('--user', help='Имя пользователя для запросов (по умолчанию первый администратор)')
+        parser.add_argument('--concurrency', type=int, default=16, help='Параллельных клиентов CRUD')
+        parser.add_argument('--reports', type=int, default=2, help='Параллельных клиентов отчётов во второй фазе')
+        parser.add_argument('--duration', type=float, default=15, help='Длительность каждой фазы, секунд')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username=options['user']) if options['user'] else User.objects.filter(role='admin')
+        user = users.order_by('pk').first()
+        if user is None:
+            raise CommandError('Нет пользователя для авторизации запросов')
+
+        self.base = urlsplit(options['url'])
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+        crud_urls = [
+            reverse(f'{basename}-list')
+            for _, viewset, basename in router.registry if issubclass(viewset, BaseViewSet)
+        ]
+        # Уникальный параметр в каждом запросе отчёта, чтобы он строился, а не брался из кэша
+        self.report_urls = (
+            f'{reverse(name)}?run={index}' for index in itertools.count() for name in REPORT_URLS
+        )
+        self.report_lock = threading.Lock()
+
+        results = {}
+        for phase, reports in (('baseline', 0), ('with_reports', options['reports'])):
+            crud, report = self.run_phase(crud_urls, options['concurrency'], reports, options['duration'])
+            results[phase] = summary = {
+                'crud': self.summarize(crud),
+                'reports': self.summarize(report),
+            }
+            self.stdout.write(f"{phase}: CRUD {self.describe(summary['crud'])}")
+            if reports:
+                self.stdout.write(f"{phase}: отчёты {self.describe(summary['reports'])}")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def run_phase(self, crud_urls, concurrency, reports, duration):
+        deadline = time.monotonic() + duration
+        crud, report = [], []
+
+        def crud_client(offset):
+            urls = itertools.cycle(crud_urls[offset % len(crud_urls):] + crud_urls[:offset % len(crud_urls)])
+            self.loop(lambda: next(urls), deadline, crud)
+
+        def report_client():
+            def next_url():
+                with self.report_lock:
+                    return next(self.report_urls)
+            self.loop(next_url, deadline, report)
+
+        threads = [threading.Thread(target=crud_client, args=(index,)) for index in range(concurrency)]
+        threads += [threading.Thread(target=report_client) for _ in range(reports)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return crud, report
+
+    def loop(self, next_url, deadline, results):
+        connection_class = http.client.HTTPSConnection if self.base.scheme == 'https' else http.client.HTTPConnection
+        connection = connection_class(self.base.netloc, timeout=120)
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                connection.request('GET', next_url(), headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+                results.append((time.perf_counter() - started, response.status))
+        finally:
+            connection.close()
+
+    def summarize(self, results):
+        timings = [elapsed for elapsed, _ in results]
+        return {
+            'requests': len(results),
+            'errors': sum(1 for _, code in results if code >= 400),
+            'p50_ms': statistics.median(timings) * 1000 if timings else None,
+            'p99_ms': percentile(timings, 0.99) * 1000 if timings else None,
+            'max_ms': max(timings) * 1000 if timings else None,
+        }
+
+    def describe(self, summary):
+        if not summary['requests']:
+            return 'нет запросов'
+        return (f"{summary['requests']} запросов, ошибок {summary['errors']}, "
+                f"p50 {summary['p50_ms']:.1f} мс, p99 {summary['p99_ms']:.1f} мс, макс. {summary['max_ms']:.1f} мс")
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+
+from api.models import DailyRevenue, DataVersion, Payment
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневной свод выручки (DailyRevenue) по таблице Payment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Первый день периода (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Последний день периода (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        date_from = self.parse(options['date_from'])
+        date_to = self.parse(options['date_to'])
+
+        payments = Payment.objects.annotate(day=TruncDate('payment_date'))
+        rollup = DailyRevenue.objects.all()
+        if date_from:
+            payments = payments.filter(day__gte=date_from)
+            rollup = rollup.filter(day__gte=date_from)
+        if date_to:
+            payments = payments.filter(day__lte=date_to)
+            rollup = rollup.filter(day__lte=date_to)
+
+        groups = payments.values('day', 'payment_type', 'revenue_membership_type').annotate(
+            total=Sum('amount'),
+            count=Count('id')
+        ).order_by()
+
+        with transaction.atomic():
+            deleted, _ = rollup.delete()
+            created = DailyRevenue.objects.bulk_create(
+                (DailyRevenue(
+                    day=g['day'],
+                    payment_type=g['payment_type'],
+                    membership_type_id=g['revenue_membership_type'],
+                    total=g['total'],
+                    count=g['count']
+                ) for g in groups.iterator()),
+                batch_size=1000
+            )
+            DataVersion.bump('payment')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено строк свода: {deleted}, создано: {len(created)}'
+        ))
+
+    def parse(self, value):
+        if value is None:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f'Некорректная дата: {value}')
+        return parsed
@@ -0,0 +1,243 @@
+import random
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from contextlib import contextmanager
+from itertools import islice
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.models import (
+    Attendance, Client, DailyRevenue, DataVersion, Hall, Membership, MembershipType, Payment, Trainer, Training,
+)
+from api.signals import VERSIONED_MODELS
+
+SURNAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+            'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров']
+NAMES = ['Александр', 'Дмитрий', 'Максим', 'Сергей', 'Андрей', 'Алексей', 'Артём', 'Илья',
+         'Кирилл', 'Михаил', 'Никита', 'Матвей', 'Роман', 'Егор', 'Арсений', 'Иван']
+SECONDNAMES = ['Александрович', 'Дмитриевич', 'Сергеевич', 'Андреевич', 'Алексеевич', 'Игоревич', '']
+SPECIALIZATIONS = ['Силовые тренировки', 'Кроссфит', 'Йога', 'Пилатес', 'Бокс', 'Плавание', 'Функциональный тренинг']
+MEMBERSHIP_TYPES = [
+    ('Месячный', 30, Decimal('3000.00')),
+    ('Квартальный', 90, Decimal('8000.00')),
+    ('Полугодовой', 180, Decimal('15000.00')),
+    ('Годовой', 365, Decimal('27000.00')),
+]
+
+# Порядок очистки: сначала зависимые таблицы. Тренеры удаляются отдельно,
+# потому что к ним могут быть привязаны учётные записи
+SEEDED_MODELS = (Attendance, Payment, DailyRevenue, Training, Membership, Client, Hall, MembershipType)
+
+FIRST_SLOT = 8
+LAST_SLOT = 21
+
+
+@contextmanager
+def keep_auto_now_add(*fields):
+    """Даёт записать в поля auto_now_add сгенерированные даты вместо текущего времени"""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими данными спортзала заданного размера (для нагрузочных замеров)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--trainers', type=int, default=20)
+        parser.add_argument('--halls', type=int, default=5)
+        parser.add_argument('--days-past', type=int, default=90, help='Дней истории тренировок и посещений')
+        parser.add_argument('--days-ahead', type=int, default=14, help='Дней расписания вперёд')
+        parser.add_argument('--fill', type=float, default=0.6, help='Доля занятых часовых слотов в зале')
+        parser.add_argument('--seed', type=int, default=0, help='Зерно генератора, одинаковое зерно даёт одинаковые данные')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--clear', action='store_true', help='Очистить данные спортзала перед генерацией')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Не спрашивать подтверждение очистки')
+
+    def handle(self, *args, **options):
+        if options['halls'] < 1 or options['trainers'] < 1:
+            raise CommandError('Нужен хотя бы один зал и один тренер')
+
+        if any(model.objects.exists() for model in SEEDED_MODELS):
+            if not options['clear']:
+                raise CommandError('В базе уже есть данные, добавьте --clear, чтобы удалить их перед генерацией')
+            if options['interactive']:
+                answer = input(f'Все клиенты, абонементы, тренировки и платежи в базе "{connection.settings_dict["NAME"]}" '
+                               'будут удалены. Введите "yes" для продолжения: ')
+                if answer != 'yes':
+                    raise CommandError('Генерация отменена')
+            self.clear()
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = date.today()
+
+        types = MembershipType.objects.bulk_create(
+            MembershipType(name=name, duration_days=days, price=price) for name, days, price in MEMBERSHIP_TYPES
+        )
+        halls = Hall.objects.bulk_create(
+            Hall(name=f'Зал {index + 1}', capacity=self.rng.randint(10, 30)) for index in range(options['halls'])
+        )
+        trainers = Trainer.objects.bulk_create(
+            Trainer(
+                surname=self.rng.choice(SURNAMES),
+                name=self.rng.choice(NAMES),
+                secondname=self.rng.choice(SECONDNAMES),
+                specialization=self.rng.choice(SPECIALIZATIONS),
+                phone=f'+7900{index:07d}'
+            ) for index in range(options['trainers'])
+        )
+
+        with keep_auto_now_add(Client._meta.get_field('registration_date'), Payment._meta.get_field('payment_date')):
+            client_ids = self.create_clients(options['clients'])
+            self.report('Клиенты', len(client_ids))
+            self.report('Абонементы и платежи', self.create_memberships(client_ids, types))
+        training_count, attendance_count = self.create_schedule(
+            client_ids, halls, trainers, types, options['days_past'], options['days_ahead'], options['fill']
+        )
+        self.report('Тренировки', training_count)
+        self.report('Записи на тренировки', attendance_count)
+
+        # bulk_create не шлёт сигналов: свод выручки и версии данных обновляем сами
+        call_command('rebuild_revenue_rollup', stdout=self.stdout)
+        DataVersion.bump(*(model._meta.model_name for model in VERSIONED_MODELS))
+
+        self.stdout.write(self.style.SUCCESS('Готово'))
+
+    def clear(self):
+        tables = [model._meta.db_table for model in SEEDED_MODELS]
+        with transaction.atomic():
+            connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables))
+            Trainer.objects.filter(user__isnull=True).delete()
+
+    def report(self, label, count):
+        self.stdout.write(f'{label}: {count}')
+
+    def insert(self, model, objects):
+        """bulk_create порциями по batch_size, не держа в памяти весь поток объектов"""
+        for chunk in chunks(objects, self.batch_size):
+            with transaction.atomic():
+                yield model.objects.bulk_create(chunk)
+
+    def aware(self, day, hour, minute=0):
+        return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+    def create_clients(self, count):
+        rng = self.rng
+        clients = (
+            Client(
+                surname=rng.choice(SURNAMES),
+                name=rng.choice(NAMES),
+                secondname=rng.choice(SECONDNAMES),
+                phone=f'+7999{index:07d}',
+                email=f'client{index}@example.com' if rng.random() < 0.7 else None,
+                birth_date=self.today - timedelta(days=rng.randint(16 * 365, 70 * 365)),
+                registration_date=self.today - timedelta(days=rng.randint(0, 3 * 365)),
+            ) for index in range(count)
+        )
+        return [client.pk for created in self.insert(Client, clients) for client in created]
+
+    def create_memberships(self, client_ids, types):
+        rng = self.rng
+        count = 0
+
+        def memberships():
+            for client_id in client_ids:
+                end = self.today + timedelta(days=rng.randint(-60, 60))
+                for _ in range(rng.randint(1, 3)):
+                    membership_type = rng.choice(types)
+                    start = end - timedelta(days=membership_type.duration_days)
+                    if end < self.today:
+                        status = 'Истёк'
+                    else:
+                        status = 'Приостановлен' if rng.random() < 0.05 else 'Активен'
+                    yield Membership(client_id=client_id, type=membership_type, start_date=start, end_date=end, status=status)
+                    end = start - timedelta(days=rng.randint(0, 30))
+
+        for chunk in chunks(memberships(), self.batch_size):
+            with transaction.atomic():
+                created = Membership.objects.bulk_create(chunk)
+                Payment.objects.bulk_create(
+                    Payment(
+                        client_id=membership.client_id,
+                        membership=membership,
+                        revenue_membership_type_id=membership.type_id,
+                        amount=membership.type.price,
+                        payment_date=self.aware(
+                            min(membership.start_date, self.today), rng.randint(FIRST_SLOT, LAST_SLOT), rng.randint(0, 59)
+                        ),
+                        payment_type=rng.choice(Payment.TYPE_CHOICES)[0]
+                    ) for membership in created
+                )
+            count += len(created)
+        return count
+
+    def create_schedule(self, client_ids, halls, trainers, types, days_past, days_ahead, fill):
+        rng = self.rng
+        now = timezone.now()
+        # В одном слоте занято не больше залов, чем есть тренеров, поэтому расписание без пересечений
+        slot_halls = halls[:len(trainers)]
+
+        def trainings():
+            for offset in range(-days_past, days_ahead + 1):
+                day = self.today + timedelta(days=offset)
+                for hour in range(FIRST_SLOT, LAST_SLOT + 1):
+                    for index, hall in enumerate(slot_halls):
+                        if rng.random() >= fill:
+                            continue
+                        start = self.aware(day, hour)
+                        if start < now:
+                            status = 'Отменена' if rng.random() < 0.05 else 'Завершена'
+                        else:
+                            status = 'Запланирована'
+                        yield Training(
+                            trainer=trainers[(index + hour + offset) % len(trainers)],
+                            training_type=rng.choice(types),
+                            hall=hall,
+                            date_time=start,
+                            duration=60,
+                            # end_time считает save(), а bulk_create его не вызывает
+                            end_time=start + timedelta(minutes=60),
+                            max_clients=min(hall.capacity, rng.randint(8, 20)),
+                            status=status
+                        )
+
+        def attendance(training):
+            if training.status == 'Отменена' or not client_ids:
+                return
+            booked = rng.sample(client_ids, min(len(client_ids), rng.randint(0, training.max_clients)))
+            for client_id in booked:
+                if training.status == 'Запланирована':
+                    yield Attendance(client_id=client_id, training=training,
+                                     status='Отмена' if rng.random() < 0.1 else 'Записан')
+                    continue
+                roll = rng.random()
+                if roll < 0.8:
+                    yield Attendance(client_id=client_id, training=training, status='Посетил', is_present=True,
+                                     check_in_time=training.date_time - timedelta(minutes=rng.randint(0, 15)))
+                else:
+                    yield Attendance(client_id=client_id, training=training,
+                                     status='Неявка' if roll < 0.95 else 'Отмена')
+
+        training_count = attendance_count = 0
+        for created in self.insert(Training, trainings()):
+            training_count += len(created)
+            visits = (visit for training in created for visit in attendance(training))
+            attendance_count += sum(len(chunk) for chunk in self.insert(Attendance, visits))
+        return training_count, attendance_count
@@ -0,0 +1,146 @@
+"""Метрики запросов в памяти процесса и их выдача в текстовом формате Prometheus.
+
+Каждый процесс веб-сервера считает свои метрики; Prometheus собирает их с
+каждого процесса отдельно и суммирует при запросе.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from .report_cache import report_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield f'{self.name}{format_labels(self.labels, labels)} {value}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # По счётчику на корзину плюс +Inf, затем сумма
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0]
+            entry[bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {labels: list(entry) for labels, entry in self._values.items()}
+        names = self.labels + ('le',)
+        for labels, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), entry):
+                cumulative += count
+                yield f'{self.name}_bucket{format_labels(names, labels + (bound,))} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.labels, labels)} {entry[-1]}'
+            yield f'{self.name}_count{format_labels(self.labels, labels)} {cumulative}'
+
+
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds', 'Время обработки запроса', ('method', 'view', 'status')
+)
+REQUEST_QUERIES = Histogram(
+    'api_request_db_queries', 'SQL-запросов на один HTTP-запрос', ('view',), QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    'api_request_db_seconds', 'Время выполнения SQL за HTTP-запрос', ('view',)
+)
+REPORT_PHASE = Histogram(
+    'api_report_phase_seconds', 'Время построения отчёта: выборка данных и вёрстка', ('report', 'format', 'phase')
+)
+SLOW_REQUESTS = Counter(
+    'api_slow_requests_total', 'Запросов дольше SLOW_REQUEST_SECONDS', ('view',)
+)
+
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_TIME, REPORT_PHASE, SLOW_REQUESTS)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.samples())
+
+    cache = report_cache.stats()
+    for key, kind in (('hits', 'counter'), ('misses', 'counter'), ('entries', 'gauge'), ('size', 'gauge')):
+        suffix = '_total' if kind == 'counter' else ''
+        lines.append(f'# TYPE api_report_cache_{key}{suffix} {kind}')
+        lines.append(f'api_report_cache_{key}{suffix} {cache[key]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class ReportTimer:
+    """Делит время построения отчёта на выборку данных и вёрстку (doc.build, запись CSV/XLSX).
+
+    Строки отчёта читаются из курсора по ходу вёрстки, поэтому выборкой
+    считается время сборщика отчёта плюс время внутри next() по строкам.
+    Отчёты строятся в пуле процессов, так что замер возвращается в веб-процесс
+    и записывается там через observe_report.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.fetch = 0.0
+
+    def collected(self):
+        self.fetch += time.perf_counter() - self.started
+
+    def rows(self, rows):
+        iterator = iter(rows)
+        while True:
+            started = time.perf_counter()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                self.fetch += time.perf_counter() - started
+                return
+            self.fetch += time.perf_counter() - started
+            yield row
+
+
+def observe_report(report, fmt, fetch, total):
+    REPORT_PHASE.observe((report, fmt, 'fetch'), fetch)
+    REPORT_PHASE.observe((report, fmt, 'build'), total - fetch)
@@ -0,0 +1,163 @@
+import heapq
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .db_router import Routing, current_routing, pin_to_primary, replica_alias
+from .metrics import REQUEST_DB_TIME, REQUEST_DURATION, REQUEST_QUERIES, SLOW_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Учёт SQL текущего запроса. Async ORM выполняет запросы в отдельном потоке,
+# но sync_to_async переносит туда контекст, так что переменная видна и там
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    """execute_wrapper, который api.signals ставит на каждое новое подключение к БД"""
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+class QueryRecorder:
+    """Считает SQL-запросы и их время, хранит только самые долгие"""
+
+    def __init__(self, keep):
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            self._keep_slowest((elapsed, self.count, sql))
+
+    def merge(self, other):
+        """Добавляет запросы, выполненные в другом процессе (пул отчётов, api.jobs)"""
+        self.count += other.count
+        self.duration += other.duration
+        for entry in other.slowest:
+            self._keep_slowest(entry)
+
+    def _keep_slowest(self, entry):
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        elif self.slowest and entry[0] > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+
+class RequestMetricsMiddleware:
+    """Время ответа, число и время SQL по эндпоинтам; медленные запросы пишутся в лог.
+
+    Для потоковых ответов меряется время до первого байта: тело CSV/JSON
+    отчётов отдаётся уже после выхода из middleware. SQL отчётов из пула
+    процессов добавляет api.jobs.render_in_pool. Учёт запроса доступен
+    как request.query_recorder.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        recorder = request.query_recorder = QueryRecorder(settings.SLOW_REQUEST_TOP_QUERIES)
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        self.record(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder = request.query_recorder = QueryRecorder(settings.SLOW_REQUEST_TOP_QUERIES)
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        self.record(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, recorder, elapsed):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUEST_DURATION.observe((request.method, view, str(response.status_code)), elapsed)
+        REQUEST_QUERIES.observe((view,), recorder.count)
+        REQUEST_DB_TIME.observe((view,), recorder.duration)
+
+        if elapsed >= settings.SLOW_REQUEST_SECONDS:
+            SLOW_REQUESTS.inc((view,))
+            queries = ''.join(
+                f'\n  {duration * 1000:.1f} мс: {sql[:500]}'
+                for duration, _, sql in sorted(recorder.slowest, reverse=True)
+            )
+            logger.warning(
+                'Медленный запрос %s %s: %.0f мс, статус %s, SQL: %d запросов за %.0f мс%s',
+                request.method, request.get_full_path(), elapsed * 1000, response.status_code,
+                recorder.count, recorder.duration * 1000, queries
+            )
+
+
+class ReplicaRoutingMiddleware:
+    """GET/HEAD/OPTIONS читают с реплики, если пользователь недавно ничего не записывал (api.db_router)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        routing = self.routing(request)
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if routing is not None:
+            pin_to_primary(routing)
+        return response
+
+    async def __acall__(self, request):
+        routing = self.routing(request)
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if routing is not None:
+            pin_to_primary(routing)
+        return response
+
+    def routing(self, request):
+        replica = replica_alias()
+        if replica is None:
+            return None
+        # Пользователь ещё не известен: пометку после записи проверит аутентификация (route_user)
+        return Routing(replica if request.method in ('GET', 'HEAD', 'OPTIONS') else None)
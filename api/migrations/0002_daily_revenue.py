@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-17 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_revenue(apps, schema_editor):
+    Payment = apps.get_model('api', 'Payment')
+    DailyRevenue = apps.get_model('api', 'DailyRevenue')
+    groups = Payment.objects.annotate(day=TruncDate('payment_date')).values(
+        'day', 'payment_type', 'membership__type'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+    DailyRevenue.objects.bulk_create(
+        (DailyRevenue(
+            day=g['day'],
+            payment_type=g['payment_type'],
+            membership_type_id=g['membership__type'],
+            total=g['total'],
+            count=g['count']
+        ) for g in groups.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('payment_type', models.CharField(choices=[('Cash', 'Cash'), ('Card', 'Card'), ('Transfer', 'Transfer')], max_length=20)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('membership_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.membershiptype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'payment_type', 'membership_type'), name='daily_revenue_unique_key', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(backfill_daily_revenue, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:30
+
+from django.db import migrations, models
+
+TRIGRAM_INDEXES = {
+    'client_surname_trgm_idx': 'UPPER(surname)',
+    'client_name_trgm_idx': 'UPPER(name)',
+    'client_phone_trgm_idx': 'UPPER(phone)',
+}
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Триграммные GIN-индексы под UPPER(col) LIKE UPPER('%...%') из ?search=, только PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, expression in TRIGRAM_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON api_client USING gin ({expression} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['surname', 'name'], name='client_surname_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['registration_date'], name='client_registration_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 6.0.1 on 2026-10-17 16:45
+
+import django.core.validators
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import F
+
+EXCLUSION_CONSTRAINTS = {
+    'training_hall_no_overlap': 'hall_id',
+    'training_trainer_no_overlap': 'trainer_id',
+}
+
+
+def fill_end_time(apps, schema_editor):
+    Training = apps.get_model('api', 'Training')
+    Training.objects.update(end_time=F('date_time') + timedelta(minutes=60))
+
+
+def create_exclusion_constraints(apps, schema_editor):
+    # Запрет пересечений на уровне БД (GiST по tstzrange), только PostgreSQL
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for name, column in EXCLUSION_CONSTRAINTS.items():
+        schema_editor.execute(
+            f'ALTER TABLE api_training ADD CONSTRAINT {name} EXCLUDE USING gist '
+            f'({column} WITH =, tstzrange(date_time, end_time) WITH &&) '
+            f"WHERE (status <> 'Отменена')"
+        )
+
+
+def drop_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in EXCLUSION_CONSTRAINTS:
+        schema_editor.execute(f'ALTER TABLE api_training DROP CONSTRAINT IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_client_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='training',
+            name='duration',
+            field=models.PositiveIntegerField(default=60, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(1440)]),
+        ),
+        migrations.AddField(
+            model_name='training',
+            name='end_time',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_end_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='training',
+            name='end_time',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='training',
+            index=models.Index(fields=['hall', 'date_time'], name='training_hall_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='training',
+            index=models.Index(fields=['trainer', 'date_time'], name='training_trainer_time_idx'),
+        ),
+        migrations.RunPython(create_exclusion_constraints, drop_exclusion_constraints),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-17 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+
+def rebuild_daily_revenue(apps, schema_editor):
+    """Фиксирует текущий тип абонемента на платежах и пересчитывает свод по нему"""
+    Membership = apps.get_model('api', 'Membership')
+    Payment = apps.get_model('api', 'Payment')
+    DailyRevenue = apps.get_model('api', 'DailyRevenue')
+
+    Payment.objects.filter(membership__isnull=False).update(revenue_membership_type=Subquery(
+        Membership.objects.filter(pk=OuterRef('membership')).values('type')[:1]
+    ))
+    groups = Payment.objects.annotate(day=TruncDate('payment_date')).values(
+        'day', 'payment_type', 'revenue_membership_type'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+    DailyRevenue.objects.all().delete()
+    DailyRevenue.objects.bulk_create(
+        (DailyRevenue(
+            day=g['day'],
+            payment_type=g['payment_type'],
+            membership_type_id=g['revenue_membership_type'],
+            total=g['total'],
+            count=g['count']
+        ) for g in groups.iterator()),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='revenue_membership_type',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='api.membershiptype'),
+        ),
+        migrations.RunPython(rebuild_daily_revenue, migrations.RunPython.noop),
+    ]
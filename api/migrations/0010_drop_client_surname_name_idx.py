@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_payment_revenue_membership_type'),
+    ]
+
+    operations = [
+        # istartswith в SQLite не использует B-tree, а на PostgreSQL поиск идёт по триграммным индексам
+        migrations.RemoveIndex(
+            model_name='client',
+            name='client_surname_name_idx',
+        ),
+    ]
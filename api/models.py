@@ -1,7 +1,20 @@
-from datetime import date
-from django.db import models
+import uuid
+from datetime import date, timedelta
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+
+# Самая длинная тренировка, минуты: граница диапазона при поиске пересечений
+MAX_TRAINING_DURATION = 24 * 60
+# Exclusion-ограничения api_training на PostgreSQL (миграция 0007): зал и тренер
+TRAINING_OVERLAP_CONSTRAINTS = {
+    'training_hall_no_overlap': 'Зал занят',
+    'training_trainer_no_overlap': 'Тренер занят',
+}
+
 
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -15,7 +28,7 @@ class User(AbstractUser):
     def save(self, *args, **kwargs):
         if self.pk is None or not self.password.startswith('pbkdf2_'):
             self.set_password(self.password)
-            super().save(*args, **kwargs)
+        super().save(*args, **kwargs)
 
 class Trainer(models.Model):
     name = models.CharField(max_length=50)
@@ -23,6 +36,7 @@ class Trainer(models.Model):
     secondname = models.CharField(max_length=50, blank=True)
     specialization = models.CharField(max_length=100)
     phone = models.CharField(max_length=20, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.surname} {self.name}"
@@ -35,12 +49,19 @@ class Client(models.Model):
     email = models.EmailField(null=True, blank=True)
     birth_date = models.DateField()
     registration_date = models.DateField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['registration_date'], name='client_registration_idx'),
+        ]
 
 class MembershipType(models.Model):
     name = models.CharField(max_length=50)
     duration_days = models.IntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def clean(self):
         if self.price < 0:
@@ -53,16 +74,34 @@ class Membership(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        if self.end_date < date.today():
-            self.status = 'Истёк'
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            # Отчёт по истекающим абонементам: status = ... AND end_date <= ... ORDER BY end_date
+            models.Index(fields=['status', 'end_date'], name='membership_status_end_idx'),
+        ]
+
+    @classmethod
+    def expire_overdue(cls, today=None):
+        """Переводит активные абонементы с прошедшим end_date в 'Истёк' одним UPDATE.
+
+        Приостановленные не трогаем: их срок продлевается при возобновлении.
+        """
+        expired = cls.objects.filter(
+            status='Активен',
+            end_date__lt=today or date.today()
+        ).update(status='Истёк', updated_at=timezone.now())
+        if expired:
+            # update() не отправляет post_save, версию данных отчётов сдвигаем сами
+            DataVersion.bump('membership')
+        return expired
 
 class Hall(models.Model):
     name = models.CharField(max_length=50, unique=True)
     capacity = models.IntegerField()
     equipment = models.TextField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 class Training(models.Model):
     STATUS_CHOICES = [('Запланирована', 'Запланирована'), ('Отменена', 'Отменена'), ('Завершена', 'Завершена')]
@@ -70,8 +109,42 @@ class Training(models.Model):
     training_type = models.ForeignKey(MembershipType, on_delete=models.CASCADE)
     hall = models.ForeignKey(Hall, on_delete=models.CASCADE)
     date_time = models.DateTimeField()
+    duration = models.PositiveIntegerField(
+        default=60, validators=[MinValueValidator(1), MaxValueValidator(MAX_TRAINING_DURATION)]
+    )  # минуты
+    end_time = models.DateTimeField(editable=False)
     max_clients = models.IntegerField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_time'], name='training_date_time_idx'),
+            # Поиск пересечений по залу и тренеру; на PostgreSQL ещё exclusion-ограничения (миграция 0007)
+            models.Index(fields=['hall', 'date_time'], name='training_hall_time_idx'),
+            models.Index(fields=['trainer', 'date_time'], name='training_trainer_time_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.end_time = self.date_time + timedelta(minutes=self.duration)
+        super().save(*args, **kwargs)
+
+    def overlapping(self):
+        """Неотменённые тренировки в том же зале или у того же тренера, пересекающиеся по времени.
+
+        Нижняя граница date_time > начало - MAX_TRAINING_DURATION ограничивает
+        просмотр индексов (hall, date_time) и (trainer, date_time) узким диапазоном.
+        """
+        end_time = self.date_time + timedelta(minutes=self.duration)
+        queryset = Training.objects.filter(
+            Q(hall_id=self.hall_id) | Q(trainer_id=self.trainer_id),
+            date_time__gt=self.date_time - timedelta(minutes=MAX_TRAINING_DURATION),
+            date_time__lt=end_time,
+            end_time__gt=self.date_time,
+        ).exclude(status='Отменена')
+        if self.pk:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
 
 class Attendance(models.Model):
     STATUS_CHOICES = [('Записан', 'Записан'), ('Посетил', 'Посетил'), ('Отмена', 'Отмена'), ('Неявка', 'Неявка')]
@@ -80,6 +153,15 @@ class Attendance(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     is_present = models.BooleanField(default=False) # Добавлено для отчетов
     check_in_time = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Подсчёт записей на тренировку по статусу
+            models.Index(fields=['training', 'status'], name='attendance_training_status_idx'),
+            # Отчёт по посещаемости читает только строки 'Посетил'
+            models.Index(fields=['training'], condition=Q(status='Посетил'), name='attendance_visited_idx'),
+        ]
 
 class Payment(models.Model):
     TYPE_CHOICES = [('Cash', 'Cash'), ('Card', 'Card'), ('Transfer', 'Transfer')]
@@ -89,7 +171,108 @@ class Payment(models.Model):
     payment_date = models.DateTimeField(auto_now_add=True)
     payment_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     description = models.CharField(max_length=200, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Тип абонемента на момент записи платежа — ключ свода DailyRevenue.
+    # Не меняется при смене типа абонемента или его удалении (api.signals)
+    revenue_membership_type = models.ForeignKey(
+        MembershipType, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='+'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ]
 
     def clean(self):
         if self.amount <= 0:
-            raise ValidationError('Сумма платежа должна быть больше нуля') # TC-PAY-02
\ No newline at end of file
+            raise ValidationError('Сумма платежа должна быть больше нуля') # TC-PAY-02
+
+class DailyRevenue(models.Model):
+    """Дневной свод выручки: день × тип оплаты × тип абонемента.
+
+    Поддерживается сигналами на каждое сохранение и удаление платежа
+    (api.signals), полностью пересчитывается командой rebuild_revenue_rollup.
+    """
+    day = models.DateField()
+    payment_type = models.CharField(max_length=20, choices=Payment.TYPE_CHOICES)
+    membership_type = models.ForeignKey(MembershipType, on_delete=models.CASCADE, null=True, blank=True)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'payment_type', 'membership_type'],
+                name='daily_revenue_unique_key',
+                nulls_distinct=False,
+            ),
+        ]
+
+    @classmethod
+    def key_for(cls, payment):
+        """Ключ строки свода по полям самого платежа (payment_date не меняется после создания)"""
+        return {
+            'day': timezone.localdate(payment.payment_date),
+            'payment_type': payment.payment_type,
+            'membership_type_id': payment.revenue_membership_type_id,
+        }
+
+    @classmethod
+    def apply(cls, key, amount, count):
+        """Добавляет amount и count к строке свода (вызывать внутри транзакции)"""
+        row, _ = cls.objects.select_for_update().get_or_create(**key)
+        cls.objects.filter(pk=row.pk).update(total=F('total') + amount, count=F('count') + count)
+
+
+class DataVersion(models.Model):
+    """Счётчик изменений данных модели, из него строятся ключи кэша отчётов.
+
+    Увеличивается сигналами post_save/post_delete (api.signals); массовые
+    update()/bulk_create() сигналов не шлют, поэтому вызывают bump() сами.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    @classmethod
+    def bump(cls, *names):
+        """Сдвигает версии после фиксации текущей транзакции.
+
+        UPDATE строки версии внутри транзакции держал бы её блокировку до
+        коммита и выстраивал в очередь все одновременные записи в модель.
+        Ключ кэша читается только из зафиксированных данных, поэтому сдвиг
+        после коммита ничего не пропускает.
+        """
+        transaction.on_commit(lambda: cls._bump(names))
+
+    @classmethod
+    def _bump(cls, names):
+        for name in names:
+            if not cls.objects.filter(name=name).update(version=F('version') + 1):
+                cls.objects.get_or_create(name=name, defaults={'version': 1})
+
+    @classmethod
+    def current(cls, names):
+        versions = dict(cls.objects.filter(name__in=names).values_list('name', 'version'))
+        return tuple(versions.get(name, 0) for name in sorted(names))
+
+    @classmethod
+    async def acurrent(cls, names):
+        queryset = cls.objects.filter(name__in=names).values_list('name', 'version')
+        versions = {name: version async for name, version in queryset}
+        return tuple(versions.get(name, 0) for name in sorted(names))
+
+
+class ReportJob(models.Model):
+    """Фоновое формирование отчёта (api.jobs), файл хранится в REPORT_JOBS_DIR"""
+    STATUS_CHOICES = [
+        ('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed'), ('expired', 'expired')
+    ]
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    report = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    error = models.TextField(blank=True)
+    file = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
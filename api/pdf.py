@@ -0,0 +1,264 @@
+"""Вёрстка PDF-отчётов на ReportLab.
+
+Модуль импортируется лениво при первом построении отчёта (см. api.views.render_report),
+чтобы процессы, обслуживающие только CRUD, не загружали ReportLab и шрифты.
+"""
+import logging
+import os
+from datetime import date
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import cm, mm
+from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from reportlab.lib import colors
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.platypus.flowables import HRFlowable
+
+logger = logging.getLogger(__name__)
+
+FONT_NAME = 'DejaVuSans'
+FONT_NAME_BOLD = 'DejaVuSans-Bold'
+
+# Регистрация шрифтов DejaVu для поддержки кириллицы
+try:
+    fonts_dir = os.path.join(settings.BASE_DIR, 'static', 'fonts')
+    if not os.path.exists(fonts_dir):
+        fonts_dir = settings.FONTS_DIR
+    pdfmetrics.registerFont(TTFont('DejaVuSans', os.path.join(fonts_dir, 'DejaVuSans.ttf')))
+    pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', os.path.join(fonts_dir, 'DejaVuSans-Bold.ttf')))
+    pdfmetrics.registerFont(TTFont('DejaVuSans-Oblique', os.path.join(fonts_dir, 'DejaVuSans-Oblique.ttf')))
+except Exception as e:
+    logger.error('Ошибка загрузки шрифтов: %s', e)
+
+
+@lru_cache(maxsize=None)
+def get_custom_styles():
+    """Таблица стилей отчётов, строится один раз на процесс"""
+    styles = getSampleStyleSheet()
+
+    styles.add(ParagraphStyle(
+        name='CustomTitle',
+        parent=styles['Heading1'],
+        fontName=FONT_NAME_BOLD,
+        fontSize=24,
+        textColor=colors.HexColor('#2c3e50'),
+        spaceAfter=10,
+        alignment=TA_CENTER,
+        leading=28
+    ))
+
+    styles.add(ParagraphStyle(
+        name='CustomSubtitle',
+        parent=styles['Normal'],
+        fontName=FONT_NAME,
+        fontSize=10,
+        textColor=colors.HexColor('#7f8c8d'),
+        spaceAfter=20,
+        alignment=TA_CENTER
+    ))
+
+    styles.add(ParagraphStyle(
+        name='SectionHeader',
+        parent=styles['Heading2'],
+        fontName=FONT_NAME_BOLD,
+        fontSize=14,
+        textColor=colors.HexColor('#27ae60'),
+        spaceBefore=15,
+        spaceAfter=10,
+        leading=16
+    ))
+
+    styles.add(ParagraphStyle(
+        name='SummaryText',
+        parent=styles['Normal'],
+        fontName=FONT_NAME,
+        fontSize=11,
+        textColor=colors.HexColor('#2c3e50'),
+        spaceBefore=5,
+        spaceAfter=5,
+        leading=14
+    ))
+
+    styles.add(ParagraphStyle(
+        name='CustomNormal',
+        parent=styles['Normal'],
+        fontName=FONT_NAME,
+        fontSize=10,
+        leading=12
+    ))
+
+    styles.add(ParagraphStyle(
+        name='Footer',
+        parent=styles['CustomNormal'],
+        fontSize=8,
+        textColor=colors.HexColor('#95a5a6'),
+        alignment=TA_CENTER
+    ))
+
+    return styles
+
+
+PAGE_MARGINS = {
+    'leftMargin': 1.5 * cm,
+    'rightMargin': 1.5 * cm,
+    'topMargin': 2 * cm,
+    'bottomMargin': 2 * cm,
+}
+
+# Строки таблиц однострочные, так что высоту можно зафиксировать
+TABLE_ROW_HEIGHT = 0.6 * cm
+
+# Общий стиль таблиц отчёта: TableStyle копируется в таблицу при setStyle,
+# поэтому один экземпляр безопасно переиспользовать
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+
+    # header
+    ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
+
+    # тело таблицы ← ВАЖНО
+    ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
+
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [
+        colors.white, colors.HexColor('#f8f9fa')
+    ]),
+])
+
+
+def create_report_header(elements, title, subtitle, styles):
+    elements.append(Paragraph(title, styles['CustomTitle']))
+    elements.append(Paragraph(subtitle, styles['CustomSubtitle']))
+    elements.append(HRFlowable(
+        width="100%",
+        thickness=2,
+        color=colors.HexColor('#27ae60'),
+        spaceBefore=5,
+        spaceAfter=15
+    ))
+
+
+def create_summary_box(elements, summary_items, styles):
+    data = []
+    for item in summary_items:
+        data.append([
+            Paragraph(f"<b>{item['label']}:</b>", styles['SummaryText']),
+            Paragraph(str(item['value']), styles['SummaryText'])
+        ])
+
+    table = Table(data, colWidths=[8 * cm, 8 * cm])
+    table.setStyle(TABLE_STYLE)
+
+    elements.append(table)
+    elements.append(Spacer(1, 0.5 * cm))
+
+
+def create_data_table(headers, rows, col_widths):
+    # Ширины колонок и высота строк заданы заранее, поэтому ReportLab не
+    # измеряет ячейки, а TABLE_STYLE разобран один раз при импорте модуля
+    table = Table([headers] + rows, colWidths=col_widths, rowHeights=TABLE_ROW_HEIGHT, repeatRows=1)
+    table.setStyle(TABLE_STYLE)
+
+    return table
+
+
+def table_rows_per_page():
+    """Сколько строк данных помещается на одну страницу под повторяемой шапкой"""
+    # 12 pt — внутренние отступы Frame у SimpleDocTemplate (по 6 pt сверху и снизу)
+    frame_height = A4[1] - PAGE_MARGINS['topMargin'] - PAGE_MARGINS['bottomMargin'] - 12
+    return int(frame_height // TABLE_ROW_HEIGHT) - 1
+
+
+class FlowableStream(list):
+    """Список flowables, который догружается из итератора по мере вёрстки документа.
+
+    ReportLab забирает элементы с головы списка, поэтому в памяти одновременно
+    находится только текущая порция, а не весь отчёт.
+    """
+
+    def __init__(self, head, tail):
+        super().__init__(head)
+        self._tail = iter(tail)
+
+    def _fill(self):
+        if not list.__len__(self):
+            flowable = next(self._tail, None)
+            if flowable is not None:
+                self.append(flowable)
+
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+
+def iter_table_chunks(headers, rows, col_widths, chunk_size):
+    """Разбивает поток строк на таблицы по chunk_size строк.
+
+    При chunk_size в одну страницу ReportLab делит каждую таблицу не больше
+    одного раза, и время вёрстки растёт линейно с числом строк.
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield create_data_table(headers, chunk, col_widths)
+            chunk = []
+    if chunk:
+        yield create_data_table(headers, chunk, col_widths)
+
+
+def stream_pdf_document(title, subtitle, summary, headers, rows, col_widths):
+    """Строит PDF-отчёт; rows может быть генератором.
+
+    Таблица собирается постранично прямо во время doc.build, а PDF пишется во
+    временный файл (на диск сверх REPORT_SPOOL_MAX_SIZE), откуда FileResponse
+    отдаёт его блоками.
+    """
+    output = SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_SIZE)
+
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        title=title,
+        **PAGE_MARGINS
+    )
+
+    styles = get_custom_styles()
+    elements = []
+
+    create_report_header(elements, title, subtitle, styles)
+
+    if summary:
+        create_summary_box(elements, summary, styles)
+
+    elements.append(Paragraph("Детализация", styles['SectionHeader']))
+    elements.append(Spacer(1, 0.3 * cm))
+
+    footer = Paragraph(
+        f"Отчёт сформирован автоматически • {date.today().strftime('%d.%m.%Y')}",
+        styles['Footer']
+    )
+
+    def tail():
+        yield from iter_table_chunks(headers, rows, col_widths, table_rows_per_page())
+        yield Spacer(1, 1 * cm)
+        yield footer
+
+    doc.build(FlowableStream(elements, tail()))
+    output.seek(0)
+    return output
@@ -0,0 +1,120 @@
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+from .models import DataVersion
+
+
+class ReportCache:
+    """LRU-кэш готовых отчётов в памяти процесса с ограничением по байтам.
+
+    Ключ включает версии данных (DataVersion), поэтому после изменения
+    данных старые записи просто перестают находиться и вытесняются.
+    Отчёты больше max_entry_bytes не кэшируются и отдаются потоком.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, content, content_type, disposition):
+        if len(content) > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._entries[key] = (content, content_type, disposition)
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_bytes': self.max_bytes,
+                'max_entry_bytes': self.max_entry_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+report_cache = ReportCache(settings.REPORT_CACHE_MAX_BYTES, settings.REPORT_CACHE_MAX_ENTRY_BYTES)
+
+
+def cached_report(name, models):
+    """Кэширует выгрузку отчёта по имени, параметрам запроса и версиям данных models.
+
+    Оборачивает асинхронное представление; файл отчёта дочитывается в пуле
+    потоков, чтобы не блокировать цикл событий.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            from .views import jwt_authenticate
+
+            try:
+                await sync_to_async(jwt_authenticate)(request)
+            except Exception as e:
+                return JsonResponse({'error': str(e)}, status=401)
+
+            params = tuple(sorted((key, tuple(values)) for key, values in request.GET.lists()))
+            # Дата входит в ключ: отчёты печатают её и считают сроки от неё
+            key = (name, params, await DataVersion.acurrent(models), date.today())
+
+            entry = report_cache.get(key)
+            if entry is not None:
+                content, content_type, disposition = entry
+                response = HttpResponse(content, content_type=content_type)
+                response['Content-Disposition'] = disposition
+                response['X-Report-Cache'] = 'hit'
+                return response
+
+            response = await view(request, *args, **kwargs)
+            if response.status_code != 200 or not response.streaming:
+                return response
+
+            # Большой отчёт не собираем в память: он уходит потоком без кэша
+            length = response.get('Content-Length')
+            if length is None or int(length) > report_cache.max_entry_bytes:
+                response['X-Report-Cache'] = 'miss'
+                return response
+
+            content = await sync_to_async(b''.join, thread_sensitive=False)(response.streaming_content)
+            response.close()
+            report_cache.set(key, content, response['Content-Type'], response['Content-Disposition'])
+
+            cached = HttpResponse(content, content_type=response['Content-Type'])
+            cached['Content-Disposition'] = response['Content-Disposition']
+            cached['X-Report-Cache'] = 'miss'
+            return cached
+        return wrapper
+    return decorator
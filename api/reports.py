@@ -0,0 +1,298 @@
+"""Источники данных отчётов и их выгрузка в PDF, CSV, XLSX и JSON.
+
+Каждый отчёт описывается ReportData: шапка, итоги, колонки и итератор строк
+из курсора БД. Строки содержат исходные значения (даты, суммы), а форматы
+выгрузки сами решают, как их показать, поэтому один источник обслуживает все
+форматы без загрузки отчёта в память.
+"""
+import csv
+import io
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Attendance, DailyRevenue, Membership, Payment, Trainer, Training
+
+ReportData = namedtuple('ReportData', 'title subtitle summary columns rows')
+# width — ширина колонки PDF в сантиметрах, display — форматирование значения для PDF
+Column = namedtuple('Column', 'header width display')
+
+EXPORT_FORMATS = {
+    'pdf': 'application/pdf',
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'json': 'application/json',
+}
+
+
+def display_datetime(value):
+    return timezone.localtime(value).strftime('%d.%m.%Y %H:%M')
+
+
+def display_date(value):
+    return value.strftime('%d.%m.%Y')
+
+
+def display_money(value):
+    return f"{float(value):,.2f} ₽"
+
+
+def display_days_left(days_left):
+    # Цвет предупреждения
+    if days_left <= 0:
+        return "ИСТЁК"
+    if days_left <= 3:
+        return f"{days_left} (срочно!)"
+    return str(days_left)
+
+
+def parse_report_period(params):
+    """Читает date_from/date_to (YYYY-MM-DD) из параметров отчёта, ValueError при ошибке"""
+    period = []
+    for param in ('date_from', 'date_to'):
+        value = params.get(param)
+        parsed = parse_date(value) if value else None
+        if value and parsed is None:
+            raise ValueError(f'Некорректная дата {param}: {value}')
+        period.append(parsed)
+    return tuple(period)
+
+
+def today_subtitle():
+    return f"Дата формирования: {date.today().strftime('%d.%m.%Y')}"
+
+
+def revenue_report(params):
+    date_from, date_to = parse_report_period(params)
+
+    payments = Payment.objects.all()
+    rollup = DailyRevenue.objects.all()
+    if date_from:
+        payments = payments.filter(payment_date__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+        rollup = rollup.filter(day__gte=date_from)
+    if date_to:
+        payments = payments.filter(payment_date__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)))
+        rollup = rollup.filter(day__lte=date_to)
+
+    # Итоги берутся из дневного свода: O(дней), а не O(платежей)
+    totals = rollup.aggregate(total=Sum('total'), count=Sum('count'))
+
+    period_text = '{} — {}'.format(
+        date_from.strftime('%d.%m.%Y') if date_from else 'начало',
+        date_to.strftime('%d.%m.%Y') if date_to else 'сегодня'
+    ) if date_from or date_to else 'Все время'
+
+    # Строки читаются курсором порциями, без создания экземпляров моделей
+    payments = payments.order_by('-payment_date').values_list(
+        'payment_date', 'client__surname', 'client__name', 'amount', 'payment_type'
+    ).iterator(chunk_size=settings.REPORT_STREAM_CHUNK_SIZE)
+
+    return ReportData(
+        title="ФИНАНСОВЫЙ ОТЧЁТ",
+        subtitle=today_subtitle(),
+        summary=[
+            {'label': 'Общая выручка', 'value': display_money(totals['total'] or 0)},
+            {'label': 'Всего платежей', 'value': totals['count'] or 0},
+            {'label': 'Период', 'value': period_text}
+        ],
+        columns=[
+            Column('Дата', 4, display_datetime),
+            Column('Клиент', 5, str),
+            Column('Сумма', 3, display_money),
+            Column('Тип оплаты', 4, str),
+        ],
+        rows=(
+            (payment_date, f"{surname} {name}", amount, payment_type)
+            for payment_date, surname, name, amount, payment_type in payments
+        )
+    )
+
+
+def attendance_report(params):
+    """Отчёт по посещаемости"""
+    attendances = Attendance.objects.filter(status='Посетил')
+
+    visits = attendances.order_by('-training__date_time').values_list(
+        'training__date_time', 'client__surname', 'client__name',
+        'training__training_type__name', 'training__trainer__surname', 'training__trainer__name'
+    ).iterator(chunk_size=settings.REPORT_STREAM_CHUNK_SIZE)
+
+    return ReportData(
+        title="ОТЧЁТ ПО ПОСЕЩАЕМОСТИ",
+        subtitle=today_subtitle(),
+        summary=[
+            {'label': 'Всего посещений', 'value': attendances.count()},
+            {'label': 'Период', 'value': 'Все время'}
+        ],
+        columns=[
+            Column('Дата', 4, display_datetime),
+            Column('Клиент', 4.5, str),
+            Column('Тренировка', 4, str),
+            Column('Тренер', 4.5, str),
+        ],
+        rows=(
+            (date_time, f"{surname} {name}", training_type, f"{trainer_surname} {trainer_name}")
+            for date_time, surname, name, training_type, trainer_surname, trainer_name in visits
+        )
+    )
+
+
+def trainer_performance_report(params):
+    """Отчёт по эффективности тренеров"""
+    trainers = Trainer.objects.annotate(
+        training_count=Count('training')
+    ).order_by('-training_count').values_list('surname', 'name', 'specialization', 'training_count')
+
+    return ReportData(
+        title="ЭФФЕКТИВНОСТЬ ТРЕНЕРОВ",
+        subtitle=today_subtitle(),
+        summary=[
+            {'label': 'Всего тренеров', 'value': Trainer.objects.count()},
+            {'label': 'Всего тренировок', 'value': Training.objects.count()}
+        ],
+        columns=[
+            Column('Тренер', 5, str),
+            Column('Специализация', 7, str),
+            Column('Кол-во тренировок', 4, str),
+        ],
+        rows=(
+            (f"{surname} {name}", specialization, training_count)
+            for surname, name, specialization, training_count in trainers.iterator()
+        )
+    )
+
+
+def expiring_memberships_report(params):
+    """Отчёт по истекающим абонементам"""
+    today = date.today()
+    soon = today + timedelta(days=7)
+    expiring = Membership.objects.filter(
+        end_date__lte=soon,
+        status='Активен'
+    )
+
+    memberships = expiring.order_by('end_date').values_list(
+        'client__surname', 'client__name', 'type__name', 'end_date'
+    ).iterator(chunk_size=settings.REPORT_STREAM_CHUNK_SIZE)
+
+    return ReportData(
+        title="ИСТЕКАЮЩИЕ АБОНЕМЕНТЫ",
+        subtitle=f"{today_subtitle()} • Проверка на {soon.strftime('%d.%m.%Y')}",
+        summary=[
+            {'label': 'Критических абонементов', 'value': expiring.count()},
+            {'label': 'Период проверки', 'value': '7 дней'}
+        ],
+        columns=[
+            Column('Клиент', 5, str),
+            Column('Тип абонемента', 5, str),
+            Column('Дата окончания', 3, display_date),
+            Column('Осталось дней', 3, display_days_left),
+        ],
+        rows=(
+            (f"{surname} {name}", type_name, end_date, (end_date - today).days)
+            for surname, name, type_name, end_date in memberships
+        )
+    )
+
+
+# Отчёты по имени: используются синхронными view и фоновыми заданиями (api.jobs)
+REPORTS = {
+    'revenue': revenue_report,
+    'attendance': attendance_report,
+    'trainer_performance': trainer_performance_report,
+    'expiring_memberships': expiring_memberships_report,
+}
+
+
+def iso_value(value):
+    """Время в CSV и JSON отдаём в местном поясе, как и в PDF"""
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat(timespec='seconds')
+    return value
+
+
+def iter_csv(report):
+    """CSV порциями по REPORT_TABLE_CHUNK_ROWS строк; BOM — чтобы Excel понял UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow([column.header for column in report.columns])
+    for index, row in enumerate(report.rows, start=1):
+        writer.writerow([iso_value(value) for value in row])
+        if index % settings.REPORT_TABLE_CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def iter_json(report):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    head = encoder.encode({
+        'title': report.title,
+        'subtitle': report.subtitle,
+        'summary': report.summary,
+        'headers': [column.header for column in report.columns],
+    })
+    yield (head[:-1] + ', "rows": [').encode()
+    separator = ''
+    for row in report.rows:
+        yield (separator + encoder.encode([iso_value(value) for value in row])).encode()
+        separator = ', '
+    yield b']}'
+
+
+def render_xlsx(report):
+    """XLSX в режиме write_only: строки пишутся в файл по одной, не копятся в памяти"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(report.title[:31])
+    sheet.append([column.header for column in report.columns])
+    for row in report.rows:
+        # Excel не хранит часовые пояса
+        sheet.append([
+            timezone.localtime(value).replace(tzinfo=None) if isinstance(value, datetime) else value
+            for value in row
+        ])
+
+    summary = workbook.create_sheet('Итоги')
+    for item in report.summary:
+        summary.append([item['label'], item['value']])
+
+    output = SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_SIZE)
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def render_pdf(report):
+    from .pdf import cm, stream_pdf_document
+
+    return stream_pdf_document(
+        title=report.title,
+        subtitle=report.subtitle,
+        summary=report.summary,
+        headers=[column.header for column in report.columns],
+        rows=([column.display(value) for column, value in zip(report.columns, row)] for row in report.rows),
+        col_widths=[column.width * cm for column in report.columns]
+    )
+
+
+def export_report(report, fmt):
+    """Файл (pdf, xlsx) или итератор байтов (csv, json) с отчётом в формате fmt"""
+    if fmt == 'pdf':
+        return render_pdf(report)
+    if fmt == 'xlsx':
+        return render_xlsx(report)
+    if fmt == 'csv':
+        return iter_csv(report)
+    if fmt == 'json':
+        return iter_json(report)
+    raise ValueError(f'Неизвестный формат: {fmt}')
@@ -1,3 +1,4 @@
+from django.utils import timezone
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -29,6 +30,63 @@ class ClientSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ClientImportSerializer(serializers.ModelSerializer):
+    """Проверка строки импорта: уникальность телефона проверяется пакетно в api.importers"""
+    phone = serializers.CharField(max_length=20)
+
+    class Meta:
+        model = Client
+        exclude = ['registration_date']
+
+
+class CardMembershipSerializer(serializers.ModelSerializer):
+    type_name = serializers.CharField(source='type.name', read_only=True)
+
+    class Meta:
+        model = Membership
+        fields = ['id', 'type', 'type_name', 'start_date', 'end_date', 'status']
+
+
+class CardPaymentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ['id', 'membership', 'amount', 'payment_date', 'payment_type', 'description']
+
+
+class CardAttendanceSerializer(serializers.ModelSerializer):
+    date_time = serializers.DateTimeField(source='training.date_time', read_only=True)
+    training_status = serializers.CharField(source='training.status', read_only=True)
+    trainer_name = serializers.CharField(source='training.trainer.surname', read_only=True)
+    hall_name = serializers.CharField(source='training.hall.name', read_only=True)
+    type_name = serializers.CharField(source='training.training_type.name', read_only=True)
+
+    class Meta:
+        model = Attendance
+        fields = ['id', 'training', 'date_time', 'training_status', 'trainer_name', 'hall_name', 'type_name',
+                  'status', 'is_present', 'check_in_time']
+
+
+class ClientCardSerializer(serializers.ModelSerializer):
+    """Карточка клиента (ClientViewSet.card): разделы берутся из prefetch с to_attr.
+
+    fields — маска полей верхнего уровня, остальные убираются из вывода.
+    """
+    memberships = CardMembershipSerializer(source='card_memberships', many=True, read_only=True)
+    payments = CardPaymentSerializer(source='card_payments', many=True, read_only=True)
+    upcoming = CardAttendanceSerializer(source='card_upcoming', many=True, read_only=True)
+    history = CardAttendanceSerializer(source='card_history', many=True, read_only=True)
+
+    class Meta:
+        model = Client
+        fields = '__all__'
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class MembershipTypeSerializer(serializers.ModelSerializer):
     class Meta:
         model = MembershipType
@@ -59,6 +117,29 @@ class TrainingSerializer(serializers.ModelSerializer):
         model = Training
         fields = '__all__'
 
+    def validate(self, attrs):
+        fields = ('hall', 'trainer', 'date_time', 'duration', 'status')
+        data = {field: getattr(self.instance, field) for field in fields} if self.instance else {}
+        data.update(attrs)
+        if data.get('status') == 'Отменена':
+            return attrs
+
+        training = Training(
+            pk=self.instance.pk if self.instance else None,
+            hall=data['hall'],
+            trainer=data['trainer'],
+            date_time=data['date_time'],
+            duration=data.get('duration', Training._meta.get_field('duration').default),
+        )
+        conflict = training.overlapping().first()
+        if conflict is not None:
+            reason = 'Зал занят' if conflict.hall_id == training.hall_id else 'Тренер занят'
+            raise serializers.ValidationError({
+                'date_time': f"{reason}: пересечение с тренировкой #{conflict.pk} "
+                             f"({timezone.localtime(conflict.date_time):%d.%m.%Y %H:%M})"
+            })
+        return attrs
+
 
 class AttendanceSerializer(serializers.ModelSerializer):
     client_details = ClientSerializer(source='client', read_only=True)
@@ -68,6 +149,57 @@ class AttendanceSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class RegisterClientSerializer(serializers.Serializer):
+    """Тело запроса TrainingViewSet.register_client"""
+    client_id = serializers.IntegerField()
+
+
+class CheckInListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        seen, repeated = set(), set()
+        for item in attrs:
+            (repeated if item['client_id'] in seen else seen).add(item['client_id'])
+        if repeated:
+            raise serializers.ValidationError(
+                f"Клиент указан несколько раз: {', '.join(map(str, sorted(repeated)))}"
+            )
+        return attrs
+
+
+class CheckInSerializer(serializers.Serializer):
+    """Строка списка отметок для TrainingViewSet.check_in"""
+    client_id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Attendance.STATUS_CHOICES, required=False)
+    is_present = serializers.BooleanField(required=False)
+    check_in_time = serializers.DateTimeField(required=False, allow_null=True)
+
+    class Meta:
+        list_serializer_class = CheckInListSerializer
+
+
+class RosterSerializer(serializers.ModelSerializer):
+    """Строка списка группы в TrainingViewSet.my_day"""
+    client_name = serializers.CharField(source='client.name', read_only=True)
+    client_surname = serializers.CharField(source='client.surname', read_only=True)
+    client_phone = serializers.CharField(source='client.phone', read_only=True)
+
+    class Meta:
+        model = Attendance
+        fields = ['id', 'client', 'client_name', 'client_surname', 'client_phone',
+                  'status', 'is_present', 'check_in_time']
+
+
+class TrainerDaySerializer(serializers.ModelSerializer):
+    hall_name = serializers.CharField(source='hall.name', read_only=True)
+    type_name = serializers.CharField(source='training_type.name', read_only=True)
+    roster = RosterSerializer(source='attendance_set', many=True, read_only=True)
+
+    class Meta:
+        model = Training
+        fields = ['id', 'date_time', 'end_time', 'duration', 'status', 'max_clients',
+                  'hall', 'hall_name', 'training_type', 'type_name', 'roster']
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     client_name = serializers.CharField(source='client.surname', read_only=True)
 
@@ -78,4 +210,27 @@ class PaymentSerializer(serializers.ModelSerializer):
     def validate_amount(self, value):
         if value <= 0:
             raise serializers.ValidationError("Сумма платежа должна быть положительной (TC-PAY-02).")
-        return value
\ No newline at end of file
+        return value
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = ['id', 'report', 'params', 'status', 'error', 'created_at', 'finished_at']
+        read_only_fields = ['status', 'error', 'created_at', 'finished_at']
+
+    def validate_report(self, value):
+        from .reports import REPORTS
+
+        if value not in REPORTS:
+            raise serializers.ValidationError(f"Неизвестный отчёт: {value}")
+        return value
+
+    def validate_params(self, value):
+        from .reports import EXPORT_FORMATS
+
+        if not isinstance(value, dict):
+            raise serializers.ValidationError("Ожидается объект")
+        if value.get('format', 'pdf') not in EXPORT_FORMATS:
+            raise serializers.ValidationError(f"Неизвестный формат: {value['format']}")
+        return value
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .middleware import record_queries
+from .models import Attendance, Client, DailyRevenue, DataVersion, Membership, MembershipType, Payment, Trainer, Training, User
+
+# Модели, от которых зависят отчёты: любое изменение сдвигает их версию
+VERSIONED_MODELS = (Payment, Attendance, Training, Trainer, Membership, MembershipType, Client)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_data_version(sender, **kwargs):
+    if sender in VERSIONED_MODELS and not kwargs.get('raw'):
+        DataVersion.bump(sender._meta.model_name)
+
+
+@receiver(pre_save, sender=Payment)
+def fix_revenue_key(sender, instance, raw=False, **kwargs):
+    """Запоминает прежнюю строку платежа и фиксирует тип абонемента для свода.
+
+    Тип берётся из абонемента только у нового платежа и при смене абонемента:
+    правка старого платежа не переносит его выручку на нынешний тип абонемента.
+    """
+    if raw:
+        return
+    previous = instance._revenue_previous = (
+        None if instance._state.adding else Payment.objects.filter(pk=instance.pk).first()
+    )
+    if previous is None or previous.membership_id != instance.membership_id:
+        instance.revenue_membership_type_id = instance.membership.type_id if instance.membership_id else None
+    else:
+        instance.revenue_membership_type_id = previous.revenue_membership_type_id
+
+
+# Свод обновляется здесь, а не во view, чтобы его не обходили админка и каскадные удаления
+@receiver(post_save, sender=Payment)
+def add_to_revenue_rollup(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    with transaction.atomic():
+        previous = instance._revenue_previous
+        if previous is not None:
+            DailyRevenue.apply(DailyRevenue.key_for(previous), -previous.amount, -1)
+        DailyRevenue.apply(DailyRevenue.key_for(instance), instance.amount, 1)
+
+
+@receiver(post_delete, sender=Payment)
+def remove_from_revenue_rollup(sender, instance, **kwargs):
+    with transaction.atomic():
+        DailyRevenue.apply(DailyRevenue.key_for(instance), -instance.amount, -1)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    key = str(instance.pk)
+    user_cache.invalidate(key)
+    # Повторно после коммита: параллельный запрос мог закэшировать ещё не изменённую строку
+    transaction.on_commit(lambda: user_cache.invalidate(key))
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
@@ -1,3 +1,1384 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Sum
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from openpyxl import load_workbook
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import jobs
+from .authentication import user_cache
+from .db_router import read_database
+from .metrics import REQUEST_QUERIES
+from .middleware import QueryRecorder, current_recorder
+from .models import (TRAINING_OVERLAP_CONSTRAINTS, Attendance, Client, DailyRevenue, DataVersion, Hall, Membership,
+                     MembershipType, Payment, ReportJob, Trainer, Training, User)
+from .pagination import KeysetPagination
+from .report_cache import ReportCache, report_cache
+from .views import TrainingViewSet
+
+
+def api_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+    return client
+
+
+def seed_rows(start, stop):
+    """По строке с номерами start..stop-1 в каждой таблице спортзала"""
+    membership_type = MembershipType.objects.get_or_create(name='Месячный', duration_days=30, price=3000)[0]
+    trainer = Trainer.objects.get_or_create(name='Иван', surname='Иванов', specialization='Фитнес', phone='+70000000000')[0]
+    hall = Hall.objects.get_or_create(name='Зал 1', capacity=20)[0]
+    base = timezone.now().replace(minute=0, second=0, microsecond=0)
+    today = date.today()
+    numbers = range(start, stop)
+
+    clients = Client.objects.bulk_create(
+        Client(name='Клиент', surname=f'Фамилия{i}', phone=f'+7999{i:07d}', birth_date=date(1990, 1, 1))
+        for i in numbers
+    )
+    memberships = Membership.objects.bulk_create(
+        Membership(client=client, type=membership_type, start_date=today, end_date=today + timedelta(days=30),
+                   status='Активен')
+        for client in clients
+    )
+    Payment.objects.bulk_create(
+        Payment(client=client, membership=membership, revenue_membership_type=membership_type, amount=3000,
+                payment_type='Card')
+        for client, membership in zip(clients, memberships)
+    )
+    trainings = Training.objects.bulk_create(
+        Training(trainer=trainer, training_type=membership_type, hall=hall, max_clients=10, status='Запланирована',
+                 date_time=base + timedelta(hours=i), end_time=base + timedelta(hours=i, minutes=60))
+        for i in numbers
+    )
+    Attendance.objects.bulk_create(
+        Attendance(client=client, training=training, status='Записан')
+        for client, training in zip(clients, trainings)
+    )
+
+
+async def render_in_process(name, params, fmt):
+    """Замена api.jobs.render_in_pool: отчёт строится в этом процессе и видит транзакцию теста"""
+    path, fetch, total, queries = await sync_to_async(jobs.render_report_file)(name, params, fmt, read_database())
+    current_recorder.get().merge(queries)
+    return jobs.TemporaryReportFile(path), fetch, total
+
+
+def response_body(response):
+    return b''.join(response.streaming_content) if response.streaming else response.content
+
+
+class QueryBudgetTests(TestCase):
+    """Число SQL-запросов списков и карточек не зависит от числа строк (без N+1)"""
+
+    # Запросов на список и на одну запись; пользователь JWT уже в кэше.
+    # Списки с conditional_list считают ещё и валидаторы
+    LIST_QUERIES = 1
+    CONDITIONAL_LIST_QUERIES = 2
+    DETAIL_QUERIES = 1
+    ENDPOINTS = ('trainer', 'client', 'membership', 'membershiptype', 'training', 'payment', 'hall', 'attendance')
+    CONDITIONAL_LISTS = ('membershiptype', 'training', 'hall')
+
+    def setUp(self):
+        self.user = User.objects.create(username='admin_test', password='secret', role='admin')
+        self.api = api_client(self.user)
+
+    def assert_queries(self, budget, url):
+        self.api.get(url)  # прогрев кэша пользователя
+        with self.assertNumQueries(budget):
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_and_detail_do_not_grow_with_rows(self):
+        seeded = 0
+        for size in (1, 100, 1000):
+            seed_rows(seeded, size)
+            seeded = size
+            for basename in self.ENDPOINTS:
+                with self.subTest(size=size, endpoint=basename):
+                    budget = self.CONDITIONAL_LIST_QUERIES if basename in self.CONDITIONAL_LISTS else self.LIST_QUERIES
+                    response = self.assert_queries(budget, reverse(f'{basename}-list'))
+                    self.assertEqual('ETag' in response, basename in self.CONDITIONAL_LISTS)
+                    pk = response.json()['results'][0]['id']
+                    self.assert_queries(self.DETAIL_QUERIES, reverse(f'{basename}-detail', args=[pk]))
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 3)
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+
+    def test_unchanged_list_and_detail_return_304(self):
+        training = Training.objects.order_by('pk').first()
+        for url in (reverse('training-list'), reverse('hall-list'), reverse('training-detail', args=[training.pk])):
+            with self.subTest(url=url):
+                etag = self.api.get(url)['ETag']
+                self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_change_invalidates_etag(self):
+        url = reverse('training-list')
+        etag = self.api.get(url)['ETag']
+        training = Training.objects.order_by('pk').first()
+        response = self.api.patch(reverse('training-detail', args=[training.pk]), {'max_clients': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class RegisterClientTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 3)
+        self.training = Training.objects.order_by('pk').first()
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+        self.url = reverse('training-register-client', args=[self.training.pk])
+
+    def test_invalid_client_ids_return_400(self):
+        missing = Client.objects.order_by('-pk').first().pk + 1
+        for client_id in (None, '', 'abc', [1], missing):
+            with self.subTest(client_id=client_id):
+                response = self.api.post(self.url, {'client_id': client_id}, format='json')
+                self.assertEqual(response.status_code, 400)
+
+    def test_cancelled_bookings_free_seats(self):
+        self.training.max_clients = 1
+        self.training.save()
+        client = Client.objects.exclude(attendance__training=self.training).first()
+
+        response = self.api.post(self.url, {'client_id': client.pk}, format='json')
+        self.assertEqual(response.status_code, 400)  # место занято записью из seed_rows
+
+        Attendance.objects.filter(training=self.training).update(status='Отмена')
+        response = self.api.post(self.url, {'client_id': client.pk}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.api.post(self.url, {'client_id': client.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnless(connection.features.has_select_for_update, 'SELECT ... FOR UPDATE не поддерживается СУБД')
+class ConcurrentBookingTests(TransactionTestCase):
+    """Одновременные записи на одну тренировку не превышают max_clients"""
+
+    def test_parallel_bookings_respect_capacity(self):
+        seed_rows(0, 30)
+        training = Training.objects.order_by('pk').first()
+        training.max_clients = 5
+        training.save()
+        user = User.objects.create(username='admin_test', password='secret', role='admin')
+        clients = list(Client.objects.exclude(attendance__training=training).values_list('pk', flat=True))
+        url = reverse('training-register-client', args=[training.pk])
+
+        barrier = threading.Barrier(len(clients))
+        statuses = []
+
+        def book(client_id):
+            try:
+                api = api_client(user)
+                barrier.wait()
+                statuses.append(api.post(url, {'client_id': client_id}, format='json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book, args=(client_id,)) for client_id in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        booked = Attendance.objects.filter(training=training).exclude(status='Отмена').count()
+        self.assertEqual(booked, training.max_clients)
+        self.assertEqual(statuses.count(201), training.max_clients - 1)
+
+
+# Узлы плана, означающие полный просмотр таблицы или отдельную сортировку
+BAD_PLAN_NODES = {
+    'postgresql': re.compile(r'Seq Scan on api_(attendance|membership|payment|training)\b|\bSort\b'),
+    'sqlite': re.compile(r'SCAN api_(attendance|membership|payment|training)\b(?! USING)|USE TEMP B-TREE FOR ORDER BY'),
+}
+
+
+@skipUnless(connection.vendor in BAD_PLAN_NODES, 'Разбор планов есть только для PostgreSQL и SQLite')
+class QueryPlanTests(TestCase):
+    """Запросы отчётов и списков обслуживаются индексами (миграция 0005).
+
+    Планы зависят от статистики: без ANALYZE SQLite сортирует отчёт по
+    посещаемости во временном B-дереве. На PostgreSQL полный просмотр и
+    сортировка запрещены на время теста, так что план показывает, есть ли
+    индекс под запрос, а не выбор планировщика на маленьких таблицах.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', clients=500, seed=1, stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_hot_paths_use_indexes(self):
+        if connection.vendor == 'postgresql':
+            # SET LOCAL откатывается вместе с транзакцией теста
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = off')
+        today = date.today()
+        queries = {
+            'attendance_report': Attendance.objects.filter(status='Посетил').order_by('-training__date_time')[:100],
+            'expiring_memberships': Membership.objects.filter(
+                status='Активен', end_date__lte=today + timedelta(days=7)
+            ).order_by('end_date'),
+            'payments_by_date': Payment.objects.order_by('-payment_date')[:100],
+            'trainings_window': Training.objects.filter(
+                date_time__gte=today, date_time__lt=today + timedelta(days=7)
+            ).order_by('date_time'),
+        }
+        bad_nodes = BAD_PLAN_NODES[connection.vendor]
+        for name, queryset in queries.items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                self.assertIsNone(bad_nodes.search(plan), f'{name} без индекса:\n{plan}')
+
+
+class RevenueRollupTests(TestCase):
+    """Свод DailyRevenue сходится с платежами при любом пути изменения"""
+
+    def setUp(self):
+        seed_rows(0, 2)
+        call_command('rebuild_revenue_rollup', stdout=io.StringIO())
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+        self.membership = Membership.objects.order_by('pk').first()
+        self.other_type = MembershipType.objects.create(name='Годовой', duration_days=365, price=30000)
+
+    def assert_rollup_matches_payments(self):
+        rollup = {
+            (row.day, row.payment_type, row.membership_type_id): (row.total, row.count)
+            for row in DailyRevenue.objects.exclude(count=0, total=0)
+        }
+        payments = {}
+        for payment in Payment.objects.all():
+            key = tuple(DailyRevenue.key_for(payment).values())
+            total, count = payments.get(key, (0, 0))
+            payments[key] = (total + payment.amount, count + 1)
+        self.assertEqual(rollup, payments)
+
+    def create_payment(self, **fields):
+        response = self.api.post(reverse('payment-list'), {
+            'client': self.membership.client_id, 'membership': self.membership.pk,
+            'amount': '100.00', 'payment_type': 'Cash', **fields,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assert_rollup_matches_payments()
+        return Payment.objects.get(pk=response.json()['id'])
+
+    def assert_bucket(self, payment, membership_type_id):
+        payment.refresh_from_db()
+        self.assertEqual(payment.revenue_membership_type_id, membership_type_id)
+        row = DailyRevenue.objects.get(day=timezone.localdate(payment.payment_date), payment_type=payment.payment_type,
+                                       membership_type_id=membership_type_id)
+        self.assertEqual((row.total, row.count), (payment.amount, 1))
+
+    def test_membership_type_change_keeps_original_bucket(self):
+        original_type = self.membership.type_id
+        payment = self.create_payment()
+        response = self.api.patch(reverse('membership-detail', args=[self.membership.pk]),
+                                  {'type': self.other_type.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        # Правка поля, не связанного с абонементом, не переносит выручку
+        response = self.api.patch(reverse('payment-detail', args=[payment.pk]), {'description': 'исправлено'},
+                                  format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_bucket(payment, original_type)
+        self.assertFalse(DailyRevenue.objects.filter(membership_type=self.other_type).exclude(count=0).exists())
+        self.assert_rollup_matches_payments()
+
+        response = self.api.delete(reverse('payment-detail', args=[payment.pk]))
+        self.assertEqual(response.status_code, 204)
+        self.assert_rollup_matches_payments()
+
+    def test_membership_delete_keeps_original_bucket(self):
+        original_type = self.membership.type_id
+        payment = self.create_payment(payment_type='Transfer')
+        Membership.objects.filter(pk=self.membership.pk).delete()
+        payment.refresh_from_db()
+        self.assertIsNone(payment.membership_id)
+        self.assert_bucket(payment, original_type)
+        self.assert_rollup_matches_payments()
+
+        payment.amount = 150
+        payment.description = 'исправлено'
+        payment.save()  # так же пишет админка
+        self.assert_bucket(payment, original_type)
+        self.assertFalse(DailyRevenue.objects.filter(membership_type=None).exclude(count=0).exists())
+        self.assert_rollup_matches_payments()
+        payment.delete()
+        self.assert_rollup_matches_payments()
+
+    def test_membership_change_moves_to_new_type(self):
+        payment = self.create_payment()
+        other = Membership.objects.create(client_id=self.membership.client_id, type=self.other_type,
+                                          start_date=date.today(), end_date=date.today(), status='Активен')
+        response = self.api.patch(reverse('payment-detail', args=[payment.pk]), {'membership': other.pk},
+                                  format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_bucket(payment, self.other_type.pk)
+        self.assert_rollup_matches_payments()
+
+    def test_update_moves_amount_between_buckets(self):
+        payment = self.create_payment()
+        response = self.api.patch(reverse('payment-detail', args=[payment.pk]),
+                                  {'amount': '250.00', 'payment_type': 'Transfer'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assert_rollup_matches_payments()
+
+    def test_cascade_delete_updates_rollup(self):
+        self.create_payment()
+        Client.objects.filter(pk=self.membership.client_id).delete()
+        self.assert_rollup_matches_payments()
+
+
+class ScheduleWindowTests(TestCase):
+    def setUp(self):
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+
+    def test_plain_date_to_includes_that_day(self):
+        response = self.api.get(reverse('training-schedule'), {'date_from': '2026-03-01', 'date_to': '2026-03-01'})
+        self.assertEqual(response.status_code, 200)
+        window = response.json()
+        self.assertEqual(
+            (window['date_from'][:10], window['date_to'][:10]), ('2026-03-01', '2026-03-02')
+        )
+
+    def test_invalid_dates_return_400(self):
+        for name in ('schedule', 'conflicts'):
+            for params in ({'date_from': '2026-02-30'}, {'date_to': '2026-13-01T10:00'}, {'date_from': 'завтра'}):
+                with self.subTest(endpoint=name, params=params):
+                    response = self.api.get(reverse(f'training-{name}'), params)
+                    self.assertEqual(response.status_code, 400)
+
+    def test_schedule_is_one_query_with_occupancy(self):
+        window = {'date_from': (date.today() - timedelta(days=1)).isoformat(),
+                  'date_to': (date.today() + timedelta(days=2)).isoformat()}
+        self.api.get(reverse('training-schedule'), window)  # прогрев кэша пользователя
+        sizes = []
+        for start, stop in ((0, 3), (3, 30)):
+            seed_rows(start, stop)
+            with self.assertNumQueries(1):
+                response = self.api.get(reverse('training-schedule'), window)
+            sizes.append(len(response.json()['results']))
+        self.assertEqual(sizes, [3, 30])
+
+        first, second = Training.objects.order_by('date_time')[:2]
+        Attendance.objects.filter(training=first).update(status='Отмена')
+        Attendance.objects.filter(training=second).update(status='Посетил')
+        rows = {row['id']: row for row in self.api.get(reverse('training-schedule'), window).json()['results']}
+        self.assertEqual((rows[first.pk]['booked'], rows[first.pk]['free']), (0, 10))
+        self.assertEqual((rows[second.pk]['booked'], rows[second.pk]['attended'], rows[second.pk]['free']), (1, 1, 9))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='admin_test', password='secret', role='admin')
+        self.api = api_client(self.user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.ids = sorted((Hall.objects.create(name=f'Зал {i}', capacity=10).pk for i in range(7)), reverse=True)
+
+    def walk(self, get):
+        """Проходит список вперёд по next и обратно по previous, возвращает id страниц"""
+        forward, backward = [], []
+        page = get(reverse('hall-list') + '?page_size=3')
+        while True:
+            forward.append([hall['id'] for hall in page['results']])
+            if page['next'] is None:
+                break
+            page = get(page['next'])
+        while page['previous'] is not None:
+            page = get(page['previous'])
+            backward.append([hall['id'] for hall in page['results']])
+        return forward, backward
+
+    def expected(self):
+        pages = [self.ids[0:3], self.ids[3:6], self.ids[6:]]
+        return pages, pages[-2::-1]
+
+    def test_follows_cursors_in_both_directions(self):
+        def get(url):
+            response = self.api.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        self.assertEqual(self.walk(get), self.expected())
+
+    async def test_follows_cursors_in_both_directions_async(self):
+        client = AsyncClient()
+        pages = []
+        url = reverse('hall-list') + '?page_size=3'
+        while url is not None:
+            response = await client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            url = pages[-1]['next']
+        url = pages[-1]['previous']
+        while url is not None:
+            response = await client.get(url, headers=self.headers)
+            pages.append(response.json())
+            url = pages[-1]['previous']
+
+        forward, backward = self.expected()
+        self.assertEqual([[hall['id'] for hall in page['results']] for page in pages], forward + backward)
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, 'page_size', 2), \
+                mock.patch.object(KeysetPagination, 'max_page_size', 5):
+            for query, size in (('', 2), ('?page_size=4', 4), ('?page_size=100', 5), ('?page_size=abc', 2)):
+                with self.subTest(query=query):
+                    response = self.api.get(reverse('hall-list') + query)
+                    self.assertEqual(len(response.json()['results']), size)
+
+    async def test_page_size_is_capped_async(self):
+        client = AsyncClient()
+        with mock.patch.object(KeysetPagination, 'max_page_size', 5):
+            response = await client.get(reverse('hall-list') + '?page_size=100', headers=self.headers)
+        self.assertEqual([hall['id'] for hall in response.json()['results']], self.ids[:5])
+
+
+class ClientSearchTests(TestCase):
+    def setUp(self):
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+        for surname, name, phone in (('Иванов', 'Пётр', '+79990000001'), ('Сидорова', 'Ивонна', '+79990000002'),
+                                     ('Petrov', 'Ivan', '+79990000003')):
+            Client.objects.create(surname=surname, name=name, phone=phone, birth_date=date(1990, 1, 1))
+
+    def search(self, **params):
+        response = self.api.get(reverse('client-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(client['surname'] for client in response.json()['results'])
+
+    def test_search_ignores_case(self):
+        for term in ('ив', 'Ив', 'ИВ'):
+            with self.subTest(term=term):
+                self.assertEqual(self.search(search=term), ['Иванов', 'Сидорова'])
+        self.assertEqual(self.search(search='iv'), ['Petrov'])
+        self.assertEqual(self.search(search='ив пётр'), ['Иванов'])
+        self.assertEqual(self.search(search='+7999000000'), ['Petrov', 'Иванов', 'Сидорова'])
+
+    def test_invalid_registration_dates_return_400(self):
+        for value in ('2026-02-30', '17.10.2026'):
+            with self.subTest(value=value):
+                response = self.api.get(reverse('client-list'), {'registration_date_from': value})
+                self.assertEqual(response.status_code, 400)
+
+    def test_has_active_membership_filter(self):
+        kind = MembershipType.objects.create(name='Месячный', duration_days=30, price=3000)
+        for surname, end_date in (('Иванов', date.today()), ('Petrov', date.today() - timedelta(days=1))):
+            Membership.objects.create(client=Client.objects.get(surname=surname), type=kind, status='Активен',
+                                      start_date=end_date - timedelta(days=30), end_date=end_date)
+        for value in ('1', 'true', 'TRUE'):
+            with self.subTest(value=value):
+                self.assertEqual(self.search(has_active_membership=value), ['Иванов'])
+        for value in ('0', 'false', 'False'):
+            with self.subTest(value=value):
+                self.assertEqual(self.search(has_active_membership=value), ['Petrov', 'Сидорова'])
+        for value in ('yes', '', '2'):
+            with self.subTest(value=value):
+                response = self.api.get(reverse('client-list'), {'has_active_membership': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('has_active_membership', response.json())
+
+
+IMPORT_CSV = (
+    'surname,name,phone,birth_date\n'
+    'Иванов,Пётр,+79990000001,1990-01-01\n'
+    'Петрова,Анна,+79990000002,не дата\n'
+    'Сидоров,Олег,+79990000001,1991-02-02\n'
+    'Смирнов,Игорь,,1992-03-03\n'
+    'Кузнецова,Ольга,+79990000005,1993-04-04\n'
+)
+IMPORT_JSONL = '\n'.join((
+    json.dumps({'surname': 'Иванов', 'name': 'Пётр', 'phone': '+79990000001', 'birth_date': '1990-01-01'}),
+    '{"surname": "Петрова",',
+    '["не объект"]',
+    '',
+    json.dumps({'surname': 'Кузнецова', 'name': 'Ольга', 'phone': '+79990000005', 'birth_date': '1993-04-04'}),
+))
+
+
+class ClientImportTests(TestCase):
+    def setUp(self):
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content if isinstance(content, bytes) else content.encode())
+        return self.api.post(reverse('client-import-file'), {'file': upload, **data}, format='multipart')
+
+    def error_lines(self, result):
+        return {item['line']: item['errors'] for item in result['errors']}
+
+    def test_csv_reports_rows_by_line(self):
+        response = self.upload('clients.csv', IMPORT_CSV)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result['created'], result['error_count']), (2, 3))
+        errors = self.error_lines(result)
+        # Строка 1 — заголовок, данные начинаются со второй
+        self.assertEqual(sorted(errors), [3, 4, 5])
+        self.assertIn('birth_date', errors[3])
+        self.assertEqual(errors[4], {'phone': ['Телефон повторяется в файле']})
+        self.assertIn('phone', errors[5])
+        self.assertEqual(sorted(Client.objects.values_list('phone', flat=True)), ['+79990000001', '+79990000005'])
+
+    def test_jsonl_reports_rows_by_line(self):
+        response = self.upload('clients.txt', IMPORT_JSONL, file_format='jsonl')
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result['created'], result['error_count']), (2, 2))
+        errors = self.error_lines(result)
+        self.assertEqual(sorted(errors), [2, 3])
+        self.assertIn('Некорректный JSON', errors[2])
+        self.assertEqual(errors[3], 'Ожидается JSON-объект')
+
+    def test_batches_commit_separately(self):
+        with override_settings(CLIENT_IMPORT_BATCH_SIZE=2), \
+                mock.patch.object(Client.objects, 'bulk_create', wraps=Client.objects.bulk_create) as bulk_create, \
+                self.captureOnCommitCallbacks(execute=True):
+            result = self.upload('clients.csv', IMPORT_CSV).json()
+        # Пачки [1, 2], [3, 4], [5]: повтор телефона из первой пачки ловится уже по базе
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [1, 1])
+        self.assertEqual(self.error_lines(result)[4], {'phone': ['Клиент с таким телефоном уже существует']})
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(DataVersion.objects.get(name='client').version, 1)
+
+    def test_malformed_files(self):
+        response = self.upload('clients.xlsx', IMPORT_CSV)
+        self.assertEqual(response.status_code, 400)
+        response = self.api.post(reverse('client-import-file'), {}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+        # Файл декодируется блоками, поэтому битый байт останавливает чтение до первой строки
+        response = self.upload('clients.csv', IMPORT_CSV.encode('cp1251'))
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual((result['created'], result['error_count']), (0, 1))
+        self.assertIn('импорт остановлен', self.error_lines(result)[1])
+        self.assertFalse(Client.objects.exists())
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'clients.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(IMPORT_JSONL)
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command('import_clients', path, '--batch-size', '1', stdout=stdout, stderr=stderr)
+            self.assertIn('Создано клиентов: 2, ошибок: 2', stdout.getvalue())
+            self.assertIn('Строка 2:', stderr.getvalue())
+            self.assertIn('Строка 3:', stderr.getvalue())
+
+            with self.assertRaises(CommandError):
+                call_command('import_clients', os.path.join(directory, 'clients.xls'))
+        self.assertEqual(Client.objects.count(), 2)
+
+
+class FakeExecutor:
+    """Пул без процессов: задания ждут, пока тест не завершит их future"""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class BrokenExecutor(FakeExecutor):
+    """Пул, у которого упал процесс: submit отказывает"""
+
+    def submit(self, fn, *args):
+        raise BrokenProcessPool('A child process terminated abruptly')
+
+
+class ReportJobQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='admin_test', password='secret', role='admin')
+        self.api = api_client(self.user)
+        self.executor = FakeExecutor()
+        patches = (mock.patch.object(jobs, 'get_executor', return_value=self.executor),
+                   mock.patch.object(jobs, '_queued_jobs', threading.BoundedSemaphore(2)))
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def post_job(self):
+        return self.api.post(reverse('reportjob-list'), {'report': 'revenue', 'params': {'format': 'csv'}},
+                             format='json')
+
+    def test_orphaned_jobs_do_not_fill_queue(self):
+        orphaned = [ReportJob.objects.create(user=self.user, report='revenue', status=status)
+                    for status in ('queued', 'running', 'running')]
+        ReportJob.objects.filter(pk__in=[job.pk for job in orphaned]).update(
+            created_at=timezone.now() - settings.REPORT_JOBS_TIMEOUT - timedelta(minutes=1))
+
+        self.assertEqual(self.post_job().status_code, 202)
+        self.assertEqual(ReportJob.objects.filter(pk__in=[job.pk for job in orphaned], status='failed').count(), 3)
+
+    def test_queue_counts_jobs_of_this_process(self):
+        self.assertEqual(self.post_job().status_code, 202)
+        self.assertEqual(self.post_job().status_code, 202)
+        self.assertEqual(self.post_job().status_code, 429)
+
+        self.executor.futures[0].set_result(None)
+        self.assertEqual(self.post_job().status_code, 202)
+
+    def test_crashed_worker_frees_queue_and_fails_job(self):
+        self.assertEqual(self.post_job().status_code, 202)
+        job = ReportJob.objects.get()
+        self.executor.futures[0].set_exception(RuntimeError('пул упал'))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'пул упал'))
+        self.assertEqual(self.post_job().status_code, 202)
+        self.assertEqual(self.post_job().status_code, 202)
+
+    def test_download_of_missing_file_expires_job(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
+            f.write(b'day,total\n')
+        job = ReportJob.objects.create(user=self.user, report='revenue', params={'format': 'csv'},
+                                       status='done', file=f.name)
+        url = reverse('reportjob-download', args=[job.pk])
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_body(response), b'day,total\n')
+
+        os.remove(f.name)
+        response = self.api.get(url)
+        self.assertEqual(response.status_code, 410)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.file), ('expired', ''))
+        self.assertEqual(self.api.get(url).status_code, 410)
+        self.assertEqual(self.api.get(reverse('reportjob-detail', args=[job.pk])).json()['status'], 'expired')
+
+
+@override_settings(DATABASE_REPLICA='replica')
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.users = []
+        for username in ('admin_test', 'admin_other'):
+            user = User.objects.create(username=username, password='secret', role='admin')
+            User.objects.using('replica').create(pk=user.pk, username=username, password='secret', role='admin')
+            self.users.append(user)
+        self.hall = Hall.objects.create(name='Зал на основной', capacity=20)
+        Hall.objects.using('replica').create(pk=self.hall.pk, name='Зал на реплике', capacity=20)
+
+    def hall_name(self, user):
+        response = api_client(user).get(reverse('hall-detail', args=[self.hall.pk]))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['name']
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.hall_name(self.users[0]), 'Зал на реплике')
+
+    def test_writer_reads_primary_after_write(self):
+        writer, other = self.users
+        response = api_client(writer).patch(reverse('hall-detail', args=[self.hall.pk]), {'capacity': 25},
+                                            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.cookies)
+
+        # Пометка привязана к пользователю, а не к cookie: SPA на другом домене её не передаёт
+        self.assertEqual(self.hall_name(writer), 'Зал на основной')
+        self.assertEqual(self.hall_name(other), 'Зал на реплике')
+
+        cache.clear()  # срок DATABASE_PRIMARY_PIN_SECONDS истёк
+        self.assertEqual(self.hall_name(writer), 'Зал на реплике')
+
+    def test_reports_render_from_routed_database(self):
+        databases = []
+
+        async def render(name, params, fmt):
+            databases.append(read_database())
+            return await render_in_process(name, params, fmt)
+
+        api = api_client(self.users[0])
+        with mock.patch('api.views.render_in_pool', render):
+            self.assertEqual(api.get(reverse('revenue_report'), {'format': 'csv'}).status_code, 200)
+            api.patch(reverse('hall-detail', args=[self.hall.pk]), {'capacity': 25}, format='json')
+            self.assertEqual(api.get(reverse('revenue_report'), {'format': 'json'}).status_code, 200)
+        self.assertEqual(databases, ['replica', None])
+
+
+REPORT_URLS = ('revenue_report', 'attendance_report', 'trainer_performance_report', 'expiring_memberships')
+
+
+class ReportFormatTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 5)
+        Attendance.objects.filter(client__surname__in=['Фамилия0', 'Фамилия1']).update(status='Посетил', is_present=True)
+        call_command('rebuild_revenue_rollup', stdout=io.StringIO())
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+        patch = mock.patch('api.views.render_in_pool', render_in_process)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+
+    def test_every_report_in_every_format(self):
+        for name in REPORT_URLS:
+            for fmt in ('pdf', 'csv', 'xlsx', 'json'):
+                with self.subTest(report=name, format=fmt):
+                    response = self.api.get(reverse(name), {'format': fmt})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertIn(f'.{fmt}', response['Content-Disposition'])
+                    self.check_document(fmt, response_body(response))
+
+    def check_document(self, fmt, body):
+        if fmt == 'pdf':
+            self.assertTrue(body.startswith(b'%PDF'))
+        elif fmt == 'csv':
+            self.assertTrue(body.startswith('\ufeff'.encode()))
+            rows = list(csv.reader(io.StringIO(body.decode('utf-8-sig'))))
+            self.assertTrue(rows[0])
+        elif fmt == 'json':
+            document = json.loads(body)
+            self.assertEqual(set(document), {'title', 'subtitle', 'summary', 'headers', 'rows'})
+            self.assertTrue(all(len(row) == len(document['headers']) for row in document['rows']))
+        else:
+            workbook = load_workbook(io.BytesIO(body), read_only=True)
+            self.assertEqual(workbook.sheetnames[-1], 'Итоги')
+
+    def test_revenue_rows_match_payments(self):
+        document = json.loads(response_body(self.api.get(reverse('revenue_report'), {'format': 'json'})))
+        self.assertEqual(len(document['rows']), Payment.objects.count())
+
+    def test_unknown_format_returns_400(self):
+        response = self.api.get(reverse('revenue_report'), {'format': 'docx'})
+        self.assertEqual(response.status_code, 400)
+        response = self.api.post(reverse('reportjob-list'), {'report': 'revenue', 'params': {'format': 'docx'}},
+                                 format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_invalid_period_returns_400(self):
+        for value in ('17.10.2026', '2026-02-30'):
+            with self.subTest(value=value):
+                response = self.api.get(reverse('revenue_report'), {'format': 'csv', 'date_from': value})
+                self.assertEqual(response.status_code, 400)
+
+
+class SeedDataTests(TestCase):
+    OPTIONS = {'clients': 40, 'trainers': 3, 'halls': 2, 'days_past': 3, 'days_ahead': 2, 'seed': 1}
+
+    def seed(self, **options):
+        call_command('seed_data', **{**self.OPTIONS, **options}, stdout=io.StringIO())
+
+    def fingerprint(self):
+        return (
+            list(Client.objects.order_by('phone').values_list('surname', 'name', 'phone', 'registration_date')),
+            list(Payment.objects.order_by('payment_date', 'client__phone').values_list(
+                'client__phone', 'amount', 'payment_date', 'payment_type')),
+            list(Training.objects.order_by('date_time', 'hall__name').values_list(
+                'hall__name', 'trainer__phone', 'date_time', 'status')),
+            list(Attendance.objects.order_by('training__date_time', 'training__hall__name', 'client__phone').values_list(
+                'client__phone', 'training__date_time', 'status')),
+        )
+
+    def test_creates_consistent_dataset(self):
+        self.seed()
+        self.assertEqual((Client.objects.count(), Trainer.objects.count(), Hall.objects.count()), (40, 3, 2))
+        self.assertEqual(Payment.objects.count(), Membership.objects.count())
+        self.assertTrue(Training.objects.exists())
+        self.assertTrue(Attendance.objects.exists())
+
+        for training in Training.objects.all():
+            self.assertEqual(training.end_time, training.date_time + timedelta(minutes=training.duration))
+            self.assertFalse(training.overlapping().exists(), training.pk)
+
+        # Свод выручки пересчитан после bulk_create
+        payments = Payment.objects.aggregate(total=Sum('amount'), count=Count('pk'))
+        rollup = DailyRevenue.objects.aggregate(total=Sum('total'), count=Sum('count'))
+        self.assertEqual(rollup, payments)
+
+    def test_same_seed_gives_same_data(self):
+        self.seed()
+        first = self.fingerprint()
+        self.seed(clear=True, interactive=False)
+        self.assertEqual(self.fingerprint(), first)
+        self.seed(clear=True, interactive=False, seed=2)
+        self.assertNotEqual(self.fingerprint(), first)
+
+    def test_keeps_existing_data_without_clear(self):
+        self.seed()
+        with self.assertRaises(CommandError):
+            self.seed()
+        self.assertEqual(Client.objects.count(), 40)
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 3)
+        call_command('rebuild_revenue_rollup', stdout=io.StringIO())
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+        self.user = User.objects.create(username='admin_test', password='secret', role='admin')
+        self.api = api_client(self.user)
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    async def test_async_client_list_detail_and_304(self):
+        client = AsyncClient()
+        response = await client.get(reverse('training-list'), headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 3)
+
+        pk = response.json()['results'][0]['id']
+        detail = await client.get(reverse('training-detail', args=[pk]), headers=self.headers)
+        self.assertEqual(detail.json()['id'], pk)
+        for url, etag in ((reverse('training-list'), response['ETag']),
+                          (reverse('training-detail', args=[pk]), detail['ETag'])):
+            with self.subTest(url=url):
+                response = await client.get(url, headers={**self.headers, 'If-None-Match': etag})
+                self.assertEqual(response.status_code, 304)
+        self.assertEqual((await client.head(reverse('training-list'), headers=self.headers)).status_code, 200)
+
+    def test_metrics_count_queries_of_async_orm(self):
+        self.api.get(reverse('training-list'))  # прогрев кэша пользователя
+        with mock.patch.object(REQUEST_QUERIES, 'observe') as observe:
+            self.api.get(reverse('training-list'))
+        observe.assert_called_once_with(('training-list',), QueryBudgetTests.CONDITIONAL_LIST_QUERIES)
+
+    def test_report_sql_from_pool_counts_for_request(self):
+        path, _, _, queries = jobs.render_report_file('revenue', {}, 'csv')
+        os.remove(path)
+        self.assertGreater(queries.count, 1)
+
+        with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as output:
+            output.write(b'ok')
+        executor = FakeExecutor()
+        executor.submit = lambda fn, *args: finished_future(result=(output.name, 0.0, 0.0, queries))
+        self.api.get(reverse('hall-list'))  # прогрев кэша пользователя
+        with mock.patch.object(jobs, 'get_executor', return_value=executor), \
+                mock.patch.object(REQUEST_QUERIES, 'observe') as observe:
+            response = self.api.get(reverse('revenue_report'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        # Версии данных для ключа кэша и SQL отчёта из пула
+        observe.assert_called_once_with(('revenue_report',), queries.count + 1)
+        self.assertEqual(response.wsgi_request.query_recorder.count, queries.count + 1)
+
+    def test_report_cache_hit_and_miss(self):
+        url = reverse('revenue_report')
+        with mock.patch('api.views.render_in_pool', side_effect=render_in_process) as render:
+            first = self.api.get(url, {'format': 'csv'})
+            second = self.api.get(url, {'format': 'csv'})
+            self.assertEqual((first['X-Report-Cache'], second['X-Report-Cache']), ('miss', 'hit'))
+            self.assertEqual(response_body(second), response_body(first))
+            self.assertEqual(render.call_count, 1)
+
+            # Новый платёж сдвигает версию данных, и отчёт строится заново
+            payment = Payment.objects.first()
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.api.post(reverse('payment-list'), {'client': payment.client_id, 'amount': 100,
+                                                                   'membership': payment.membership_id,
+                                                                   'payment_type': 'Cash'}, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.api.get(url, {'format': 'csv'})['X-Report-Cache'], 'miss')
+            self.assertEqual(self.api.get(url, {'format': 'json'})['X-Report-Cache'], 'miss')
+            self.assertEqual(render.call_count, 3)
+
+    def test_large_report_streams_without_caching(self):
+        url = reverse('revenue_report')
+        with mock.patch('api.views.render_in_pool', side_effect=render_in_process) as render, \
+                mock.patch.object(report_cache, 'max_entry_bytes', 10):
+            for _ in range(2):
+                response = self.api.get(url, {'format': 'csv'})
+                self.assertTrue(response.streaming)
+                self.assertEqual(response['X-Report-Cache'], 'miss')
+                response_body(response)
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(report_cache.stats()['entries'], 0)
+
+    def test_cache_entry_limit_is_separate_from_total(self):
+        cache = ReportCache(max_bytes=100, max_entry_bytes=40)
+        cache.set('big', b'x' * 41, 'text/csv', '')
+        self.assertIsNone(cache.get('big'))
+        for key in 'abc':
+            cache.set(key, b'x' * 40, 'text/csv', '')
+        # Третья запись вытесняет первую, но не весь кэш
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 80)
+
+    def test_report_over_pending_limit_returns_503(self):
+        pending = threading.BoundedSemaphore(1)
+        pending.acquire()
+        with mock.patch.object(jobs, '_pending_renders', pending):
+            response = self.api.get(reverse('revenue_report'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+class TrainerDayTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 4)
+        self.trainer = Trainer.objects.get()
+        self.user = User.objects.create(username='trainer_test', password='secret', role='trainer',
+                                        trainer_id=self.trainer.pk)
+        self.api = api_client(self.user)
+        other = Trainer.objects.create(name='Пётр', surname='Петров', specialization='Йога', phone='+70000000001')
+        Training.objects.filter(pk=Training.objects.order_by('pk').last().pk).update(trainer=other)
+        self.window = {'date_from': (date.today() - timedelta(days=1)).isoformat(),
+                       'date_to': (date.today() + timedelta(days=2)).isoformat()}
+
+    def my_day(self, user=None, **params):
+        return (api_client(user) if user else self.api).get(reverse('training-my-day'), params)
+
+    def test_returns_own_trainings_with_sorted_roster(self):
+        training = Training.objects.filter(trainer=self.trainer).order_by('date_time').first()
+        for index, surname in enumerate(('Яковлев', 'Абрамов')):
+            client = Client.objects.create(name='Клиент', surname=surname, phone=f'+799800000{index:02d}',
+                                           birth_date=date(1990, 1, 1))
+            Attendance.objects.create(client=client, training=training, status='Записан')
+
+        results = self.my_day(**self.window).json()['results']
+        self.assertEqual([item['id'] for item in results],
+                         list(Training.objects.filter(trainer=self.trainer).order_by('date_time').values_list('id', flat=True)))
+        roster = [row['client_surname'] for row in results[0]['roster']]
+        self.assertEqual(roster, sorted(roster))
+        self.assertEqual(roster[0], 'Абрамов')
+
+    def test_query_count_does_not_grow_with_trainings(self):
+        self.my_day(**self.window)  # прогрев кэша пользователя
+        sizes = []
+        for stop in (None, 40):
+            if stop:
+                seed_rows(4, stop)
+            with self.assertNumQueries(2):
+                response = self.my_day(**self.window)
+            sizes.append(len(response.json()['results']))
+        self.assertGreater(sizes[1], sizes[0])
+
+    def test_only_linked_trainers_allowed(self):
+        admin = User.objects.create(username='admin_test', password='secret', role='admin')
+        unlinked = User.objects.create(username='trainer_unlinked', password='secret', role='trainer')
+        for user in (admin, unlinked):
+            with self.subTest(user=user.username):
+                self.assertEqual(self.my_day(user).status_code, 403)
+
+    def test_invalid_window_returns_400(self):
+        self.assertEqual(self.my_day(date_from='2026-02-30').status_code, 400)
+        self.assertEqual(self.my_day(date_to='завтра').status_code, 400)
+
+
+class ClientCardTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 1)
+        self.client_row = Client.objects.get()
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+        self.url = reverse('client-card', args=[self.client_row.pk])
+
+    def add_history(self, count):
+        """count абонементов с платежами и по count прошедших и будущих посещений клиента"""
+        membership_type = MembershipType.objects.get()
+        seeded = Training.objects.order_by('pk').first()
+        now = timezone.now()
+        memberships = Membership.objects.bulk_create(
+            Membership(client=self.client_row, type=membership_type, start_date=date.today() - timedelta(days=30 * i),
+                       end_date=date.today() - timedelta(days=30 * i - 30), status='Истёк')
+            for i in range(1, count + 1)
+        )
+        Payment.objects.bulk_create(
+            Payment(client=self.client_row, membership=membership, revenue_membership_type=membership_type,
+                    amount=3000, payment_type='Cash')
+            for membership in memberships
+        )
+        trainings = Training.objects.bulk_create(
+            Training(trainer=seeded.trainer, training_type=membership_type, hall=seeded.hall, max_clients=10,
+                     status='Запланирована', date_time=now + timedelta(days=days), end_time=now + timedelta(days=days, hours=1))
+            for i in range(1, count + 1) for days in (-i, i)
+        )
+        Attendance.objects.bulk_create(
+            Attendance(client=self.client_row, training=training, status='Записан') for training in trainings
+        )
+
+    def get_card(self, **params):
+        response = self.api.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_query_count_does_not_grow_with_history(self):
+        self.get_card()  # прогрев кэша пользователя
+        for count in (1, 30):
+            self.add_history(count)
+            with self.subTest(count=count), self.assertNumQueries(5):
+                self.get_card()
+
+    @override_settings(CLIENT_CARD_LIMITS={'memberships': 3, 'payments': 2, 'upcoming': 2, 'history': 3})
+    def test_sections_are_limited_and_ordered(self):
+        self.add_history(5)
+        card = self.get_card()
+        self.assertEqual({name: len(card[name]) for name in ('memberships', 'payments', 'upcoming', 'history')},
+                         {'memberships': 3, 'payments': 2, 'upcoming': 2, 'history': 3})
+        upcoming = [visit['date_time'] for visit in card['upcoming']]
+        history = [visit['date_time'] for visit in card['history']]
+        self.assertEqual(upcoming, sorted(upcoming))
+        self.assertEqual(history, sorted(history, reverse=True))
+        self.assertEqual(card['memberships'][0]['start_date'], date.today().isoformat())
+
+    def test_fields_mask(self):
+        self.add_history(2)
+        self.get_card()  # прогрев кэша пользователя
+        with self.assertNumQueries(2):
+            card = self.get_card(fields='id, surname,payments')
+        self.assertEqual(set(card), {'id', 'surname', 'payments'})
+
+    def test_unknown_field_and_missing_client(self):
+        self.assertEqual(self.api.get(self.url, {'fields': 'id,password'}).status_code, 400)
+        missing = reverse('client-card', args=[self.client_row.pk + 1])
+        self.assertEqual(self.api.get(missing).status_code, 404)
+
+
+def finished_future(result=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+
+class ProcessPoolRecoveryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='admin_test', password='secret', role='admin')
+        self.api = api_client(self.user)
+        patch = mock.patch.object(jobs, '_executor', BrokenExecutor())
+        patch.start()
+        self.addCleanup(patch.stop)
+        report_cache.clear()
+        self.addCleanup(report_cache.clear)
+
+    def post_job(self):
+        return self.api.post(reverse('reportjob-list'), {'report': 'revenue', 'params': {'format': 'csv'}},
+                             format='json')
+
+    def test_broken_pool_is_rebuilt_for_next_job(self):
+        rebuilt = FakeExecutor()
+        with mock.patch.object(jobs, 'ProcessPoolExecutor', return_value=rebuilt):
+            response = self.post_job()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(rebuilt.futures), 1)
+        self.assertIs(jobs._executor, rebuilt)
+
+    def test_job_fails_when_new_pool_also_refuses(self):
+        slots = threading.BoundedSemaphore(1)
+        with mock.patch.object(jobs, 'ProcessPoolExecutor', return_value=BrokenExecutor()), \
+                mock.patch.object(jobs, '_queued_jobs', slots):
+            response = self.post_job()
+        self.assertEqual(response.status_code, 503)
+        job = ReportJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('недоступен', job.error)
+        self.assertTrue(slots.acquire(blocking=False))  # место в очереди освобождено
+
+    def test_report_view_uses_rebuilt_pool(self):
+        rebuilt = FakeExecutor()
+        with mock.patch.object(jobs, 'ProcessPoolExecutor', return_value=rebuilt):
+            # Отчёт «строится» в новом пуле: тест сам завершает его future готовым файлом
+            with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as output:
+                output.write(b'ok')
+            rebuilt.submit = lambda fn, *args: finished_future(result=(output.name, 0.0, 0.0, QueryRecorder(0)))
+            response = self.api.get(reverse('revenue_report'), {'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response_body(response), b'ok')
+
+    def test_report_view_returns_503_when_pool_is_down(self):
+        crashing = FakeExecutor()
+        crashing.submit = lambda fn, *args: finished_future(error=BrokenProcessPool('worker killed'))
+        for executor in (BrokenExecutor(), crashing):
+            with self.subTest(executor=executor), \
+                    mock.patch.object(jobs, 'ProcessPoolExecutor', return_value=executor):
+                jobs._executor = BrokenExecutor()
+                response = self.api.get(reverse('revenue_report'), {'format': 'csv'})
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '5')
+
+    def test_real_pool_survives_killed_worker(self):
+        jobs._executor = None
+        self.addCleanup(lambda: jobs._executor and jobs._drop_executor(jobs._executor))
+        crashed = jobs.submit(os._exit, 1)
+        with self.assertRaises(BrokenProcessPool):
+            crashed.result(timeout=60)
+        self.assertEqual(jobs.submit(abs, -3).result(timeout=60), 3)
+
+
+class DataVersionTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 1)
+
+    def test_version_moves_after_commit(self):
+        before = DataVersion.current(['payment'])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                payment = Payment.objects.get()
+                payment.description = 'исправлено'
+                payment.save()
+                # Внутри транзакции строка версии не обновлялась и не заблокирована
+                self.assertEqual(DataVersion.current(['payment']), before)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(DataVersion.current(['payment']), (before[0] + 1,))
+
+    def test_rolled_back_write_keeps_version(self):
+        before = DataVersion.current(['payment'])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Payment.objects.get().delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(DataVersion.current(['payment']), before)
+
+
+class ExpireMembershipsTests(TestCase):
+    def setUp(self):
+        kind = MembershipType.objects.create(name='Месячный', duration_days=30, price=3000)
+        client = Client.objects.create(surname='Иванов', name='Пётр', phone='+79990000001', birth_date=date(1990, 1, 1))
+        today = date.today()
+        self.memberships = {
+            (status, end_date): Membership.objects.create(client=client, type=kind, status=status,
+                                                          start_date=end_date - timedelta(days=30), end_date=end_date)
+            for status in ('Активен', 'Приостановлен')
+            for end_date in (today - timedelta(days=2), today - timedelta(days=1), today, today + timedelta(days=10))
+        }
+
+    def statuses(self):
+        return {key: Membership.objects.get(pk=membership.pk).status for key, membership in self.memberships.items()}
+
+    def test_only_overdue_active_memberships_expire(self):
+        today = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Membership.expire_overdue(), 2)
+        expected = {(status, end_date): 'Истёк' if status == 'Активен' and end_date < today else status
+                    for status, end_date in self.memberships}
+        self.assertEqual(self.statuses(), expected)
+        self.assertEqual(DataVersion.objects.get(name='membership').version, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Membership.expire_overdue(), 0)
+        self.assertEqual(DataVersion.objects.get(name='membership').version, 1)
+
+    def test_command_reports_count(self):
+        stdout = io.StringIO()
+        call_command('expire_memberships', stdout=stdout)
+        self.assertIn('Истёкших абонементов: 2', stdout.getvalue())
+        self.assertEqual(Membership.objects.filter(status='Истёк').count(), 2)
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create(username='admin_test', password='secret', role='admin')
+        self.api = api_client(self.user)
+        self.key = str(self.user.pk)
+
+    def request(self):
+        return self.api.get(reverse('hall-list')).status_code
+
+    def test_user_is_cached_between_requests(self):
+        self.assertEqual(self.request(), 200)
+        self.assertIsNotNone(user_cache.get(self.key))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.request(), 200)
+        self.assertFalse([q for q in queries if 'api_user' in q['sql']])
+
+    def test_save_and_delete_evict_user(self):
+        self.assertEqual(self.request(), 200)
+        self.user.first_name = 'Пётр'
+        self.user.save()
+        self.assertIsNone(user_cache.get(self.key))
+
+        self.assertEqual(self.request(), 200)
+        self.user.delete()
+        self.assertIsNone(user_cache.get(self.key))
+        self.assertEqual(self.request(), 401)
+
+    def test_deactivated_user_is_rejected_within_ttl(self):
+        self.assertEqual(self.request(), 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(user_cache.get(self.key))
+        self.assertEqual(self.request(), 401)
+
+
+class CheckInTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 4)
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+        self.training = Training.objects.order_by('pk').first()
+        self.training.max_clients = 3
+        self.training.save()
+        self.clients = list(Client.objects.order_by('pk'))
+        Attendance.objects.filter(training=self.training).delete()
+        for client, status in zip(self.clients, ('Записан', 'Записан', 'Записан', 'Отмена')):
+            Attendance.objects.create(client=client, training=self.training, status=status)
+        self.url = reverse('training-check-in', args=[self.training.pk])
+
+    def check_in(self, items):
+        return self.api.post(self.url, items, format='json')
+
+    def attendance(self, client):
+        return Attendance.objects.get(training=self.training, client=client)
+
+    def test_marks_whole_group(self):
+        first, second, third, _ = self.clients
+        with self.captureOnCommitCallbacks(execute=True):
+            before = DataVersion.current(['attendance'])
+            response = self.check_in([
+                {'client_id': first.pk, 'status': 'Посетил'},
+                {'client_id': second.pk, 'status': 'Неявка'},
+                {'client_id': third.pk, 'status': 'Посетил', 'check_in_time': '2026-03-01T10:05:00Z'},
+            ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], 3)
+        self.assertEqual(DataVersion.current(['attendance']), (before[0] + 1,))
+
+        self.assertTrue(self.attendance(first).is_present)
+        self.assertIsNotNone(self.attendance(first).check_in_time)
+        self.assertEqual((self.attendance(second).is_present, self.attendance(second).check_in_time), (False, None))
+        # Время в ответе в часовом поясе проекта (Europe/Moscow), как у остальных эндпоинтов
+        times = {row['client_id']: row['check_in_time'] for row in response.json()['results']}
+        self.assertEqual(times[third.pk], '2026-03-01T13:05:00+03:00')
+        self.assertTrue(times[first.pk].endswith('+03:00'))
+
+    def test_unknown_clients_are_reported_per_row(self):
+        outsider = Client.objects.create(name='Клиент', surname='Чужой', phone='+79980000001', birth_date=date(1990, 1, 1))
+        response = self.check_in([
+            {'client_id': self.clients[0].pk, 'status': 'Посетил'},
+            {'client_id': outsider.pk, 'status': 'Посетил'},
+            {'client_id': 10 ** 9, 'status': 'Посетил'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], 1)
+        errors = [row['client_id'] for row in response.json()['results'] if 'error' in row]
+        self.assertEqual(errors, [outsider.pk, 10 ** 9])
+        self.assertFalse(Attendance.objects.filter(client=outsider).exists())
+
+    def test_revived_booking_respects_capacity(self):
+        cancelled = self.clients[3]
+        response = self.check_in([{'client_id': cancelled.pk, 'status': 'Посетил'}])
+        self.assertEqual(response.json()['results'], [{'client_id': cancelled.pk, 'error': 'Мест больше нет'}])
+        self.assertEqual(self.attendance(cancelled).status, 'Отмена')
+
+        # Отмена в том же запросе освобождает место
+        response = self.check_in([
+            {'client_id': self.clients[0].pk, 'status': 'Отмена'},
+            {'client_id': cancelled.pk, 'status': 'Посетил'},
+        ])
+        self.assertEqual(response.json()['updated'], 2)
+        self.assertEqual(self.attendance(cancelled).status, 'Посетил')
+        self.assertEqual(Attendance.objects.filter(training=self.training).exclude(status='Отмена').count(), 3)
+
+    def test_duplicate_clients_return_400(self):
+        client_id = self.clients[0].pk
+        response = self.check_in([{'client_id': client_id, 'status': 'Посетил'},
+                                  {'client_id': client_id, 'status': 'Неявка'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.attendance(self.clients[0]).status, 'Записан')
+
+
+class TrainingOverlapTests(TestCase):
+    def setUp(self):
+        seed_rows(0, 1)
+        self.api = api_client(User.objects.create(username='admin_test', password='secret', role='admin'))
+        self.training = Training.objects.get()
+        self.other_trainer = Trainer.objects.create(name='Пётр', surname='Петров', specialization='Йога',
+                                                    phone='+70000000001')
+        self.other_hall = Hall.objects.create(name='Зал 2', capacity=20)
+
+    def payload(self, **fields):
+        return {'trainer': self.training.trainer_id, 'hall': self.training.hall_id,
+                'training_type': self.training.training_type_id, 'max_clients': 10, 'status': 'Запланирована',
+                'date_time': (self.training.date_time + timedelta(minutes=30)).isoformat(), 'duration': 60, **fields}
+
+    def test_overlapping_create_and_update_are_rejected(self):
+        for fields in ({}, {'trainer': self.other_trainer.pk}, {'hall': self.other_hall.pk}):
+            with self.subTest(fields=fields):
+                response = self.api.post(reverse('training-list'), self.payload(**fields), format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('date_time', response.json())
+
+        later = self.payload(trainer=self.other_trainer.pk, hall=self.other_hall.pk)
+        response = self.api.post(reverse('training-list'), later, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.api.patch(reverse('training-detail', args=[response.json()['id']]),
+                                  {'hall': self.training.hall_id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        # Отменённая тренировка место не занимает
+        response = self.api.post(reverse('training-list'), self.payload(status='Отменена'), format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def integrity_error(self, pgcode=None, constraint=None):
+        # Так psycopg передаёт SQLSTATE и имя ограничения в исходной ошибке драйвера
+        cause = Exception('violation')
+        cause.pgcode, cause.diag = pgcode, mock.Mock(constraint_name=constraint)
+        error = IntegrityError('violation')
+        error.__cause__ = cause
+        serializer = mock.Mock()
+        serializer.save.side_effect = error
+        return serializer
+
+    def test_only_exclusion_violation_becomes_400(self):
+        view = TrainingViewSet()
+        for constraint in TRAINING_OVERLAP_CONSTRAINTS:
+            with self.subTest(constraint=constraint):
+                with self.assertRaises(ValidationError) as raised:
+                    view._save_without_overlap(self.integrity_error('23P01', constraint))
+                self.assertIn(TRAINING_OVERLAP_CONSTRAINTS[constraint], str(raised.exception.detail['date_time']))
+
+        for pgcode, constraint in (('23503', 'api_training_hall_id_fk'), ('23502', None)):
+            with self.subTest(pgcode=pgcode), self.assertRaises(IntegrityError):
+                view._save_without_overlap(self.integrity_error(pgcode, constraint))
+
+    def test_conflicts_lists_pairs_in_local_time(self):
+        clash = Training.objects.create(
+            trainer=self.other_trainer, hall=self.training.hall, training_type=self.training.training_type,
+            max_clients=10, status='Запланирована', date_time=self.training.date_time + timedelta(minutes=30))
+        day = timezone.localdate(self.training.date_time)
+        response = self.api.get(reverse('training-conflicts'), {'date_from': day.isoformat(),
+                                                                'date_to': (day + timedelta(days=1)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        window = response.json()
+        self.assertEqual(len(window['results']), 1)
+        conflict = window['results'][0]
+        self.assertEqual((conflict['kind'], conflict['resource']), ('hall', self.training.hall_id))
+        self.assertEqual(sorted(conflict['trainings']), sorted([self.training.pk, clash.pk]))
+        self.assertEqual(parse_datetime(conflict['start']), clash.date_time)
+        self.assertEqual(parse_datetime(conflict['end']), self.training.end_time)
+        for value in (window['date_from'], window['date_to'], conflict['start'], conflict['end']):
+            self.assertTrue(value.endswith('+03:00'), value)
@@ -12,6 +12,7 @@ router.register(r'trainings', TrainingViewSet)
 router.register(r'payments', PaymentViewSet)
 router.register(r'halls', HallViewSet)
 router.register(r'attendance', AttendanceViewSet)
+router.register(r'report-jobs', ReportJobViewSet)
 
 urlpatterns = [
     path('auth/login/', MTokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -22,4 +23,6 @@ urlpatterns = [
     path('reports/attendance/', attendance_report, name='attendance_report'),
     path('reports/trainer_performance/', trainer_performance_report, name='trainer_performance_report'),
     path('reports/expiring_memberships/', expiring_memberships_report, name='expiring_memberships'),
+
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
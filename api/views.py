@@ -1,19 +1,34 @@
-from io import BytesIO
-from datetime import timedelta
-from django.http import FileResponse, JsonResponse
+import hashlib
+import logging
+import os
+from datetime import datetime, time, timedelta
+from functools import update_wrapper
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.conf import settings
-from rest_framework import viewsets, status
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Prefetch, Q, Value, prefetch_related_objects
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import classonlymethod
+from django.utils.http import http_date
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import mixins, serializers, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
 
-from backend.settings import FONTS_DIR
+from .authentication import CachedJWTAuthentication
+
+logger = logging.getLogger(__name__)
 
 
 def jwt_authenticate(request):
-    jwt_auth = JWTAuthentication()
+    jwt_auth = CachedJWTAuthentication()
     user_auth_tuple = jwt_auth.authenticate(request)
 
     if user_auth_tuple is None:
@@ -23,46 +38,154 @@ def jwt_authenticate(request):
     request.user = user
     return user
 
-# Импорт ReportLab
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm, mm
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-    from reportlab.lib import colors
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    from reportlab.platypus.flowables import HRFlowable
-    import os
-
-    REPORTLAB_AVAILABLE = True
-
-    # Регистрация шрифтов DejaVu для поддержки кириллицы
-    try:
-        fonts_dir = os.path.join(settings.BASE_DIR, 'static', 'fonts')
-        if os.path.exists(fonts_dir):
-            pdfmetrics.registerFont(TTFont('DejaVuSans', os.path.join(fonts_dir, 'DejaVuSans.ttf')))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', os.path.join(fonts_dir, 'DejaVuSans-Bold.ttf')))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Oblique', os.path.join(fonts_dir, 'DejaVuSans-Oblique.ttf')))
-            FONT_NAME = 'DejaVuSans'
-            FONT_NAME_BOLD = 'DejaVuSans-Bold'
-        else:
-            pdfmetrics.registerFont(TTFont('DejaVuSans', os.path.join(FONTS_DIR, 'DejaVuSans.ttf')))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', os.path.join(FONTS_DIR, 'DejaVuSans-Bold.ttf')))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Oblique', os.path.join(FONTS_DIR, 'DejaVuSans-Oblique.ttf')))
-    except Exception as e:
-        print(f"Ошибка загрузки шрифтов: {e}")
-
-except ImportError:
-    REPORTLAB_AVAILABLE = False
-
 from .serializers import *
 from .permissions import IsStaffOrReadOnly
+from .pagination import KeysetPagination
+from .metrics import observe_report, render_metrics
+from .report_cache import cached_report
+from .reports import EXPORT_FORMATS
+from .jobs import PoolUnavailable, QueueFull, enqueue_report, render_in_pool
+from .importers import IMPORT_FORMATS, import_clients
+
+
+def parse_window(params, default_days=7):
+    """Окно времени из ?date_from=&date_to= (дата или дата-время), по умолчанию неделя от сегодня"""
+    bounds = []
+    for param in ('date_from', 'date_to'):
+        value = params.get(param)
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            # Сначала дата: parse_datetime принимает и её (как полночь)
+            parsed_date = parse_date(value)
+            parsed = None if parsed_date is not None else parse_datetime(value)
+        except ValueError:
+            # Формат верный, но такой даты нет (2026-02-30)
+            parsed_date = parsed = None
+        if parsed_date is not None:
+            # Дата без времени в date_to означает «включая этот день»
+            parsed = datetime.combine(parsed_date + timedelta(days=1 if param == 'date_to' else 0), time.min)
+        elif parsed is None:
+            raise serializers.ValidationError({param: f'Некорректная дата: {value}'})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        bounds.append(parsed)
+
+    start, end = bounds
+    if start is None:
+        start = timezone.make_aware(datetime.combine(date.today(), time.min)) if end is None else end - timedelta(days=default_days)
+    if end is None:
+        end = start + timedelta(days=default_days)
+    if end <= start:
+        raise serializers.ValidationError({'date_to': 'Конец окна должен быть позже начала'})
+    if end - start > timedelta(days=settings.SCHEDULE_MAX_DAYS):
+        raise serializers.ValidationError({'date_to': f'Окно не больше {settings.SCHEDULE_MAX_DAYS} дней'})
+    return start, end
 
 
 class BaseViewSet(viewsets.ModelViewSet):
     permission_classes = [IsStaffOrReadOnly]
+    pagination_class = KeysetPagination
+    # ETag/Last-Modified у списка: MAX(updated_at) и COUNT по всей выборке на
+    # каждый запрос. Включается только для небольших справочников и расписания
+    conditional_list = False
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        """Маршруты list/retrieve отдаются асинхронным представлением.
+
+        GET читает данные через async ORM прямо в цикле событий, поэтому под
+        ASGI чтение не ждёт, пока другие запросы строят отчёты. Остальные
+        методы тех же маршрутов выполняет обычный синхронный DRF.
+        """
+        view = super().as_view(actions, **initkwargs)
+        if actions.get('get') not in ('list', 'retrieve'):
+            return view
+
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await sync_view(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            self.action_map = {'get': actions['get'], 'head': actions['get']}
+            self.request = request
+            self.args = args
+            self.kwargs = kwargs
+            return await self.async_dispatch(request, *args, **kwargs)
+
+        update_wrapper(async_view, view)
+        del async_view.__wrapped__
+        return async_view
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        """dispatch из APIView для асинхронных list/retrieve"""
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Аутентификация и проверка прав; пользователь обычно берётся из кэша без SQL
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            handler = self.alist if self.action == 'list' else self.aretrieve
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    # Условный GET: валидаторы считаются по updated_at без сериализации ответа.
+    # Изменения связанных моделей (например, фамилии тренера в списке тренировок)
+    # ETag не меняют. Сериализаторы здесь не должны ходить в БД: всё, что они
+    # читают, подгружается select_related в queryset
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        if not self.conditional_list:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        state = await queryset.aaggregate(last_modified=Max('updated_at'), count=Count('pk'))
+        etag = self._etag(request.get_full_path(), state['last_modified'], state['count'])
+        not_modified = self._not_modified(request, etag, state['last_modified'])
+        if not_modified is not None:
+            return not_modified
+
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return self._with_validators(response, etag, state['last_modified'])
+
+    async def aretrieve(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        self.check_object_permissions(request, instance)
+
+        etag = self._etag(instance.pk, instance.updated_at)
+        not_modified = self._not_modified(request, etag, instance.updated_at)
+        if not_modified is not None:
+            return not_modified
+        return self._with_validators(Response(self.get_serializer(instance).data), etag, instance.updated_at)
+
+    def _etag(self, *parts):
+        digest = hashlib.md5(repr((self.basename,) + parts).encode(), usedforsecurity=False).hexdigest()
+        return f'W/"{digest}"'
+
+    def _not_modified(self, request, etag, last_modified):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+    def _with_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 class MTokenObtainPairView(TokenObtainPairView):
@@ -77,474 +200,473 @@ class TrainerListViewSet(BaseViewSet):
 class HallViewSet(BaseViewSet):
     queryset = Hall.objects.all()
     serializer_class = HallSerializer
+    conditional_list = True
 
 
 class ClientViewSet(BaseViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+
+        # ?search= по фамилии, имени и телефону: каждое слово должно найтись хотя бы в одном поле.
+        # На PostgreSQL подстрока ищется по триграммным индексам (миграция 0006),
+        # на остальных СУБД — только префикс. Индекс ему не помогает: istartswith
+        # превращается в LIKE ... ESCAPE, и SQLite всё равно читает таблицу целиком.
+        # LIKE в SQLite не учитывает регистр только для ASCII, поэтому там кириллица
+        # ищется в написаниях «как введено», строчными и с заглавной буквы.
+        postgresql = connection.vendor == 'postgresql'
+        lookup = 'icontains' if postgresql else 'istartswith'
+        for term in params.get('search', '').split():
+            variants = {term} if postgresql else {term, term.lower(), term.capitalize()}
+            match = Q()
+            for variant in variants:
+                for field in ('surname', 'name', 'phone'):
+                    match |= Q(**{f'{field}__{lookup}': variant})
+            queryset = queryset.filter(match)
+
+        for param, field_lookup in (('registration_date_from', 'gte'), ('registration_date_to', 'lte')):
+            value = params.get(param)
+            if value:
+                try:
+                    parsed = parse_date(value)
+                except ValueError:
+                    parsed = None
+                if parsed is None:
+                    raise serializers.ValidationError({param: f'Некорректная дата: {value}'})
+                queryset = queryset.filter(**{f'registration_date__{field_lookup}': parsed})
+
+        has_active = params.get('has_active_membership')
+        if has_active is not None:
+            active = Exists(Membership.objects.filter(
+                client=OuterRef('pk'), status='Активен', end_date__gte=date.today()
+            ))
+            flag = has_active.lower()
+            if flag not in ('1', 'true', '0', 'false'):
+                raise serializers.ValidationError(
+                    {'has_active_membership': f'Ожидается 1/true или 0/false: {has_active}'})
+            queryset = queryset.filter(active if flag in ('1', 'true') else ~active)
+
+        return queryset
+
+    @action(detail=True, methods=['get'])
+    def card(self, request, pk=None):
+        """Карточка клиента для ресепшена: абонементы, платежи, ближайшие и прошедшие посещения.
+
+        Пять SQL-запросов при любой истории: клиент и по одному на раздел,
+        каждый раздел ограничен CLIENT_CARD_LIMITS. ?fields=id,surname,payments
+        оставляет только перечисленные поля, невыбранные разделы не запрашиваются.
+        """
+        fields = request.query_params.get('fields')
+        if fields:
+            fields = [name.strip() for name in fields.split(',') if name.strip()]
+            unknown = sorted(set(fields) - set(ClientCardSerializer().fields))
+            if unknown:
+                raise serializers.ValidationError({'fields': f"Неизвестные поля: {', '.join(unknown)}"})
+        else:
+            fields = None
+
+        client = self.get_object()
+        limits = settings.CLIENT_CARD_LIMITS
+        now = timezone.now()
+        attendance = Attendance.objects.select_related('training__trainer', 'training__hall', 'training__training_type')
+        # Срез в Prefetch ограничивает число записей на клиента (оконной функцией в SQL)
+        sections = {
+            'memberships': Prefetch(
+                'membership_set',
+                queryset=Membership.objects.select_related('type').order_by('-start_date', '-id')[:limits['memberships']],
+                to_attr='card_memberships',
+            ),
+            'payments': Prefetch(
+                'payment_set',
+                queryset=Payment.objects.order_by('-payment_date', '-id')[:limits['payments']],
+                to_attr='card_payments',
+            ),
+            'upcoming': Prefetch(
+                'attendance_set',
+                queryset=attendance.filter(training__date_time__gte=now).order_by('training__date_time')[:limits['upcoming']],
+                to_attr='card_upcoming',
+            ),
+            'history': Prefetch(
+                'attendance_set',
+                queryset=attendance.filter(training__date_time__lt=now).order_by('-training__date_time')[:limits['history']],
+                to_attr='card_history',
+            ),
+        }
+        prefetch_related_objects([client], *(
+            prefetch for name, prefetch in sections.items() if fields is None or name in fields
+        ))
+        return Response(ClientCardSerializer(client, fields=fields).data)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_file(self, request):
+        """Импорт клиентов из CSV/JSONL файла (поле file, формат по расширению или file_format)"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Файл не передан'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.data.get('file_format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if fmt not in IMPORT_FORMATS:
+            return Response({'error': f'Неподдерживаемый формат: {fmt}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = import_clients(upload, fmt, batch_size=settings.CLIENT_IMPORT_BATCH_SIZE)
+        return Response(result, status=status.HTTP_200_OK)
+
 
 class MembershipViewSet(BaseViewSet):
-    queryset = Membership.objects.all()
+    queryset = Membership.objects.select_related('client', 'type')
     serializer_class = MembershipSerializer
 
 class MembershipTypeViewSet(BaseViewSet):
     queryset = MembershipType.objects.all()
     serializer_class = MembershipTypeSerializer
+    conditional_list = True
 
 class AttendanceViewSet(BaseViewSet):
-    queryset = Attendance.objects.all()
+    queryset = Attendance.objects.select_related('client')
     serializer_class = AttendanceSerializer
 
 class TrainingViewSet(BaseViewSet):
-    queryset = Training.objects.all()
+    queryset = Training.objects.select_related('trainer', 'hall', 'training_type')
     serializer_class = TrainingSerializer
+    conditional_list = True
+
+    # Гонку между проверкой в сериализаторе и вставкой ловит exclusion-ограничение (PostgreSQL)
+    def perform_create(self, serializer):
+        self._save_without_overlap(serializer)
+
+    def perform_update(self, serializer):
+        self._save_without_overlap(serializer)
+
+    def _save_without_overlap(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError as e:
+            # Остальные нарушения целостности (FK, NOT NULL) — не пересечения, пусть всплывают
+            cause = e.__cause__
+            constraint = getattr(getattr(cause, 'diag', None), 'constraint_name', None)
+            if constraint not in TRAINING_OVERLAP_CONSTRAINTS and getattr(cause, 'pgcode', None) != '23P01':
+                raise
+            reason = TRAINING_OVERLAP_CONSTRAINTS.get(constraint, 'Зал или тренер заняты')
+            raise serializers.ValidationError({'date_time': f'{reason}: пересечение с другой тренировкой'})
+
+    @action(detail=False, methods=['get'])
+    def conflicts(self, request):
+        """Пересекающиеся тренировки (зал или тренер) в окне времени"""
+        start, end = parse_window(request.query_params)
+        trainings = list(Training.objects.filter(
+            date_time__gt=start - timedelta(minutes=MAX_TRAINING_DURATION),
+            date_time__lt=end,
+            end_time__gt=start,
+        ).exclude(status='Отменена').values('id', 'hall', 'trainer', 'date_time', 'end_time'))
+
+        results = []
+        for kind in ('hall', 'trainer'):
+            # Заметающая прямая по началу тренировки внутри каждого зала/тренера
+            trainings.sort(key=lambda t: (t[kind], t['date_time']))
+            active = []
+            for training in trainings:
+                active = [a for a in active if a[kind] == training[kind] and a['end_time'] > training['date_time']]
+                for other in active:
+                    results.append({
+                        'kind': kind,
+                        'resource': training[kind],
+                        'trainings': [other['id'], training['id']],
+                        'start': timezone.localtime(training['date_time']),
+                        'end': timezone.localtime(min(other['end_time'], training['end_time'])),
+                    })
+                active.append(training)
+
+        # Время в ответе в часовом поясе проекта, как у TrainingSerializer
+        return Response({'date_from': timezone.localtime(start), 'date_to': timezone.localtime(end), 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def schedule(self, request):
+        """Расписание на окно времени с заполненностью, одним SQL-запросом"""
+        start, end = parse_window(request.query_params)
+        trainings = Training.objects.filter(date_time__gte=start, date_time__lt=end)
+        for param in ('hall', 'trainer'):
+            value = request.query_params.get(param)
+            if value:
+                if not value.isdigit():
+                    raise serializers.ValidationError({param: 'Ожидается id'})
+                trainings = trainings.filter(**{f'{param}_id': value})
+
+        rows = trainings.values(
+            'id', 'date_time', 'status', 'max_clients', 'trainer', 'hall', 'training_type',
+            trainer_name=F('trainer__surname'),
+            hall_name=F('hall__name'),
+            type_name=F('training_type__name'),
+        ).annotate(
+            booked=Count('attendance', filter=~Q(attendance__status='Отмена')),
+            attended=Count('attendance', filter=Q(attendance__status='Посетил')),
+        ).annotate(
+            free=Greatest(F('max_clients') - F('booked'), Value(0)),
+        ).order_by('date_time')
+
+        return Response({'date_from': start, 'date_to': end, 'results': list(rows)})
+
+    @action(detail=False, methods=['get'])
+    def my_day(self, request):
+        """Тренировки текущего тренера в окне времени (по умолчанию сегодня) со списком группы.
+
+        Два SQL-запроса при любом числе тренировок: тренировки с залом и типом
+        и записи с клиентами через prefetch.
+        """
+        trainer_id = getattr(request.user, 'trainer_id', None)
+        if request.user.role != 'trainer' or trainer_id is None:
+            raise PermissionDenied('Доступно только тренеру, привязанному к карточке тренера')
+
+        start, end = parse_window(request.query_params, default_days=1)
+        roster = Attendance.objects.select_related('client').order_by('client__surname', 'client__name')
+        trainings = Training.objects.filter(
+            trainer_id=trainer_id, date_time__gte=start, date_time__lt=end
+        ).select_related('hall', 'training_type').prefetch_related(
+            Prefetch('attendance_set', queryset=roster)
+        ).order_by('date_time')
+
+        serializer = TrainerDaySerializer(trainings, many=True)
+        return Response({'date_from': start, 'date_to': end, 'results': serializer.data})
 
     @action(detail=True, methods=['post'])
     def register_client(self, request, pk=None):
         """Запись клиента на тренировку с проверкой вместимости (ТЗ 4.1)"""
         training = self.get_object()
-        client_id = request.data.get('client_id')
+        serializer = RegisterClientSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': 'Клиент не найден'}, status=status.HTTP_400_BAD_REQUEST)
+        client_id = serializer.validated_data['client_id']
+
+        if not Client.objects.filter(pk=client_id).exists():
+            return Response({'error': 'Клиент не найден'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # Блокировка строки тренировки сериализует одновременные записи на неё
+            training = Training.objects.select_for_update().get(pk=training.pk)
+            bookings = Attendance.objects.filter(training=training).exclude(status='Отмена')
+
+            if bookings.filter(client_id=client_id).exists():
+                return Response({'error': 'Клиент уже записан'}, status=status.HTTP_400_BAD_REQUEST)
+
+            if bookings.count() >= training.max_clients:
+                return Response({'error': 'Мест больше нет'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Повторная запись после отмены переиспользует прежнюю строку
+            restored = Attendance.objects.filter(
+                training=training, client_id=client_id, status='Отмена'
+            ).update(status='Записан', is_present=False, check_in_time=None, updated_at=timezone.now())
+            if not restored:
+                Attendance.objects.create(
+                    client_id=client_id,
+                    training=training,
+                    status='Записан'
+                )
+        return Response({'status': 'Клиент записан'}, status=status.HTTP_201_CREATED)
 
-        if training.attendance_set.count() >= training.max_clients:
-            return Response({'error': 'Мест больше нет'}, status=status.HTTP_400_BAD_REQUEST)
+    @action(detail=True, methods=['post'])
+    def check_in(self, request, pk=None):
+        """Отметка посещаемости всей группы одним запросом.
 
-        Attendance.objects.create(
-            client_id=client_id,
-            training=training,
-            status='Записан'
-        )
-        return Response({'status': 'Клиент записан'}, status=status.HTTP_201_CREATED)
+        Вернуть отменённую запись можно только при свободном месте, как в register_client.
+        """
+        training = self.get_object()
+        serializer = CheckInSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        results = []
+        now = timezone.now()
+        as_local = serializers.DateTimeField()
+        with transaction.atomic():
+            # Та же блокировка, что в register_client: места считаются без гонок
+            training = Training.objects.select_for_update().get(pk=training.pk)
+            rows = {
+                a.client_id: a for a in Attendance.objects.select_for_update().filter(
+                    training=training,
+                    client_id__in=[item['client_id'] for item in serializer.validated_data]
+                )
+            }
+            booked = Attendance.objects.filter(training=training).exclude(status='Отмена').count()
+            changed = []
+            for item in serializer.validated_data:
+                attendance = rows.get(item['client_id'])
+                if attendance is None:
+                    results.append({'client_id': item['client_id'], 'error': 'Клиент не записан на тренировку'})
+                    continue
+
+                status_value = item.get('status', attendance.status)
+                if attendance.status == 'Отмена' and status_value != 'Отмена':
+                    if booked >= training.max_clients:
+                        results.append({'client_id': item['client_id'], 'error': 'Мест больше нет'})
+                        continue
+                    booked += 1
+                elif attendance.status != 'Отмена' and status_value == 'Отмена':
+                    booked -= 1
+
+                attendance.status = status_value
+                attendance.is_present = item.get('is_present', attendance.status == 'Посетил')
+                if 'check_in_time' in item:
+                    attendance.check_in_time = item['check_in_time']
+                elif attendance.is_present and attendance.check_in_time is None:
+                    attendance.check_in_time = now
+                elif not attendance.is_present:
+                    attendance.check_in_time = None
+
+                attendance.updated_at = now
+                changed.append(attendance)
+                results.append({
+                    'client_id': attendance.client_id,
+                    'id': attendance.id,
+                    'status': attendance.status,
+                    'is_present': attendance.is_present,
+                    # В часовом поясе проекта, как в остальных ответах API
+                    'check_in_time': as_local.to_representation(attendance.check_in_time)
+                    if attendance.check_in_time else None,
+                })
+
+            if changed:
+                Attendance.objects.bulk_update(changed, ['status', 'is_present', 'check_in_time', 'updated_at'])
+                # bulk_update не отправляет post_save и не трогает auto_now, поэтому
+                # updated_at выставлен выше, а версию данных отчётов сдвигаем сами
+                DataVersion.bump('attendance')
+
+        return Response({'updated': len(changed), 'results': results})
 
 
 class PaymentViewSet(BaseViewSet):
-    queryset = Payment.objects.all()
+    queryset = Payment.objects.select_related('client', 'membership')
     serializer_class = PaymentSerializer
 
-
-def get_custom_styles():
-    styles = getSampleStyleSheet()
-
-    styles.add(ParagraphStyle(
-        name='CustomTitle',
-        parent=styles['Heading1'],
-        fontName=FONT_NAME_BOLD,
-        fontSize=24,
-        textColor=colors.HexColor('#2c3e50'),
-        spaceAfter=10,
-        alignment=TA_CENTER,
-        leading=28
-    ))
-
-    styles.add(ParagraphStyle(
-        name='CustomSubtitle',
-        parent=styles['Normal'],
-        fontName=FONT_NAME,
-        fontSize=10,
-        textColor=colors.HexColor('#7f8c8d'),
-        spaceAfter=20,
-        alignment=TA_CENTER
-    ))
-
-    styles.add(ParagraphStyle(
-        name='SectionHeader',
-        parent=styles['Heading2'],
-        fontName=FONT_NAME_BOLD,
-        fontSize=14,
-        textColor=colors.HexColor('#27ae60'),
-        spaceBefore=15,
-        spaceAfter=10,
-        leading=16
-    ))
-
-    styles.add(ParagraphStyle(
-        name='SummaryText',
-        parent=styles['Normal'],
-        fontName=FONT_NAME,
-        fontSize=11,
-        textColor=colors.HexColor('#2c3e50'),
-        spaceBefore=5,
-        spaceAfter=5,
-        leading=14
-    ))
-
-    styles.add(ParagraphStyle(
-        name='CustomNormal',
-        parent=styles['Normal'],
-        fontName=FONT_NAME,
-        fontSize=10,
-        leading=12
-    ))
-
-    return styles
-
-
-def create_report_header(elements, title, subtitle, styles):
-    elements.append(Paragraph(title, styles['CustomTitle']))
-    elements.append(Paragraph(subtitle, styles['CustomSubtitle']))
-    elements.append(HRFlowable(
-        width="100%",
-        thickness=2,
-        color=colors.HexColor('#27ae60'),
-        spaceBefore=5,
-        spaceAfter=15
-    ))
-
-
-def create_summary_box(elements, summary_items, styles):
-    data = []
-    for item in summary_items:
-        data.append([
-            Paragraph(f"<b>{item['label']}:</b>", styles['SummaryText']),
-            Paragraph(str(item['value']), styles['SummaryText'])
-        ])
-
-    table = Table(data, colWidths=[8 * cm, 8 * cm])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-
-        # header
-        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
-
-        # тело таблицы ← ВАЖНО
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [
-            colors.white, colors.HexColor('#f8f9fa')
-        ]),
-    ]))
-
-    elements.append(table)
-    elements.append(Spacer(1, 0.5 * cm))
-
-
-def create_data_table(headers, rows, col_widths):
-    table = Table([headers] + rows, colWidths=col_widths, repeatRows=1)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-
-        # header
-        ('FONTNAME', (0, 0), (-1, 0), FONT_NAME_BOLD),
-
-        # тело таблицы ← ВАЖНО
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [
-            colors.white, colors.HexColor('#f8f9fa')
-        ]),
-    ]))
-
-    return table
-
-
-def create_pdf_document(title, subtitle, summary, headers, rows, col_widths):
-    buffer = BytesIO()
-
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        leftMargin=1.5 * cm,
-        rightMargin=1.5 * cm,
-        topMargin=2 * cm,
-        bottomMargin=2 * cm,
-        title=title
-    )
-
-    styles = get_custom_styles()
-    elements = []
-
-    create_report_header(elements, title, subtitle, styles)
-
-    if summary:
-        create_summary_box(elements, summary, styles)
-
-    elements.append(Paragraph("Детализация", styles['SectionHeader']))
-    elements.append(Spacer(1, 0.3 * cm))
-
-    elements.append(create_data_table(headers, rows, col_widths))
-
-    elements.append(Spacer(1, 1 * cm))
-    elements.append(Paragraph(
-        f"Отчёт сформирован автоматически • {date.today().strftime('%d.%m.%Y')}",
-        ParagraphStyle(
-            'Footer',
-            parent=styles['CustomNormal'],
-            fontSize=8,
-            textColor=colors.HexColor('#95a5a6'),
-            alignment=TA_CENTER
+    # Свод DailyRevenue обновляют сигналы (api.signals) в той же транзакции, что и платёж
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+
+
+
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Фоновое формирование отчётов: POST ставит в очередь, GET — статус, download — файл"""
+    queryset = ReportJob.objects.all()
+    serializer_class = ReportJobSerializer
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = serializer.save(user=request.user)
+        try:
+            enqueue_report(job)
+        except QueueFull as e:
+            return Response({'error': str(e)}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        except PoolUnavailable as e:
+            job.refresh_from_db()
+            return Response({**self.get_serializer(job).data, 'error': str(e)},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        job = self.get_object()
+        gone = Response({'error': 'Файл отчёта больше недоступен', 'status': 'expired'}, status=status.HTTP_410_GONE)
+        if job.status == 'expired':
+            return gone
+        if job.status != 'done':
+            return Response({'error': 'Отчёт ещё не готов', 'status': job.status}, status=status.HTTP_409_CONFLICT)
+        fmt = job.params.get('format', 'pdf')
+        try:
+            stream = open(job.file, 'rb')
+        except FileNotFoundError:
+            # Файл удалили вне cleanup_report_jobs (например, вместе с контейнером)
+            ReportJob.objects.filter(pk=job.pk).update(status='expired', file='')
+            return gone
+        return FileResponse(
+            stream,
+            as_attachment=True,
+            filename=f'{job.report}_report.{fmt}',
+            content_type=EXPORT_FORMATS[fmt]
         )
-    ))
-
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
 
-
-
-def revenue_report(request):
-    try:
-        user = jwt_authenticate(request)
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=401)
-    from .models import Payment
-
-    payments = Payment.objects.select_related('client').order_by('-payment_date')
-    total = sum(float(p.amount) for p in payments)
-
-    summary = [
-        {'label': 'Общая выручка', 'value': f"{total:,.2f} ₽"},
-        {'label': 'Всего платежей', 'value': payments.count()}
-    ]
-
-    headers = ['Дата', 'Клиент', 'Сумма', 'Тип оплаты']
-    rows = [[
-        p.payment_date.strftime('%d.%m.%Y %H:%M'),
-        f"{p.client.surname} {p.client.name}",
-        f"{float(p.amount):,.2f} ₽",
-        p.payment_type
-    ] for p in payments]
-
-    pdf = create_pdf_document(
-        title="ФИНАНСОВЫЙ ОТЧЁТ",
-        subtitle=f"Дата формирования: {date.today().strftime('%d.%m.%Y')}",
-        summary=summary,
-        headers=headers,
-        rows=rows,
-        col_widths=[4 * cm, 5 * cm, 3 * cm, 4 * cm]
-    )
-
-    return FileResponse(
-        pdf,
-        as_attachment=True,
-        filename='revenue_report.pdf',
-        content_type='application/pdf'
-    )
-
-
-
-def attendance_report(request):
-    try:
-        user = jwt_authenticate(request)
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=401)
-    """Отчёт по посещаемости"""
-    if not REPORTLAB_AVAILABLE:
-        return Response(
-            {'error': 'PDF библиотека не установлена. Установите: pip install reportlab'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+async def render_report(request, name):
+    """Строит отчёт в пуле процессов (api.jobs.render_in_pool) и отдаёт файл.
+
+    Вёрстка занимает процессор на секунды, поэтому выполняется вне веб-процесса:
+    цикл событий и поток ORM в это время обслуживают остальные запросы.
+    """
+    fmt = request.GET.get('format', 'pdf')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse(
+            {'error': f'Неизвестный формат: {fmt}. Доступны: {", ".join(EXPORT_FORMATS)}'},
+            status=status.HTTP_400_BAD_REQUEST
         )
 
     try:
-        from .models import Attendance
-
-        attendances = Attendance.objects.select_related(
-            'client', 'training', 'training__trainer', 'training__training_type'
-        ).filter(status='Посетил').order_by('-training__date_time')
-
-        # Summary данные
-        summary_items = [
-            {'label': 'Всего посещений', 'value': attendances.count()},
-            {'label': 'Период', 'value': 'Все время'}
-        ]
-
-        # Подготовка данных для таблицы
-        headers = ['Дата', 'Клиент', 'Тренировка', 'Тренер']
-        data_rows = []
-
-        for a in attendances:
-            data_rows.append([
-                a.training.date_time.strftime('%d.%m.%Y %H:%M'),
-                f"{a.client.surname} {a.client.name}",
-                a.training.training_type.name,
-                f"{a.training.trainer.surname} {a.training.trainer.name}"
-            ])
-
-        # Ширина колонок
-        col_widths = [4 * cm, 4.5 * cm, 4 * cm, 4.5 * cm]
-
-        # Генерация PDF
-        pdf = create_pdf_document(
-            title="ОТЧЁТ ПО ПОСЕЩАЕМОСТИ",
-            subtitle=f"Дата формирования: {date.today().strftime('%d.%m.%Y')}",
-            summary=summary_items,
-            headers=headers,
-            rows=data_rows,
-            col_widths=col_widths
-        )
-
-        return FileResponse(
-            pdf,
-            as_attachment=True,
-            filename='revenue_report.pdf',
-            content_type='application/pdf'
+        output, fetch, total = await render_in_pool(name, request.GET.dict(), fmt)
+    except (QueueFull, PoolUnavailable) as e:
+        response = JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = '5'
+        return response
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ImportError as e:
+        return JsonResponse(
+            {'error': f'Библиотека для формата {fmt} не установлена. Установите: pip install {e.name}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"Ошибка генерации PDF: {error_detail}")
-        return Response(
-            {'error': f'Ошибка генерации PDF: {str(e)}'},
+        logger.exception('Ошибка генерации отчёта %s', name)
+        return JsonResponse(
+            {'error': f'Ошибка генерации отчёта: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+    observe_report(name, fmt, fetch, total)
+    return FileResponse(output, as_attachment=True, filename=f'{name}_report.{fmt}', content_type=EXPORT_FORMATS[fmt])
 
 
-def trainer_performance_report(request):
-    try:
-        user = jwt_authenticate(request)
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=401)
-    """Отчёт по эффективности тренеров"""
-    if not REPORTLAB_AVAILABLE:
-        return Response(
-            {'error': 'PDF библиотека не установлена. Установите: pip install reportlab'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+@cached_report('revenue', ('payment', 'client', 'membership'))
+async def revenue_report(request):
+    return await render_report(request, 'revenue')
 
-    try:
-        from .models import Trainer
-        from django.db.models import Count
-
-        trainers = Trainer.objects.annotate(
-            training_count=Count('training')
-        ).order_by('-training_count')
-
-        total_trainings = sum(t.training_count for t in trainers)
-
-        # Summary данные
-        summary_items = [
-            {'label': 'Всего тренеров', 'value': trainers.count()},
-            {'label': 'Всего тренировок', 'value': total_trainings}
-        ]
-
-        # Подготовка данных для таблицы
-        headers = ['Тренер', 'Специализация', 'Кол-во тренировок']
-        data_rows = []
-
-        for t in trainers:
-            data_rows.append([
-                f"{t.surname} {t.name}",
-                t.specialization,
-                str(t.training_count)
-            ])
-
-        # Ширина колонок
-        col_widths = [5 * cm, 7 * cm, 4 * cm]
-
-        # Генерация PDF
-        pdf = create_pdf_document(
-            title="ЭФФЕКТИВНОСТЬ ТРЕНЕРОВ",
-            subtitle=f"Дата формирования: {date.today().strftime('%d.%m.%Y')}",
-            summary=summary_items,
-            headers=headers,
-            rows=data_rows,
-            col_widths=col_widths
-        )
 
-        return FileResponse(
-            pdf,
-            as_attachment=True,
-            filename='revenue_report.pdf',
-            content_type='application/pdf'
-        )
+@cached_report('attendance', ('attendance', 'training', 'client', 'trainer', 'membershiptype'))
+async def attendance_report(request):
+    return await render_report(request, 'attendance')
 
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"Ошибка генерации PDF: {error_detail}")
-        return Response(
-            {'error': f'Ошибка генерации PDF: {str(e)}'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
 
+@cached_report('trainer_performance', ('trainer', 'training'))
+async def trainer_performance_report(request):
+    return await render_report(request, 'trainer_performance')
 
 
-def expiring_memberships_report(request):
-    try:
-        user = jwt_authenticate(request)
-    except Exception as e:
-        return JsonResponse({'error': str(e)}, status=401)
-    """Отчёт по истекающим абонементам"""
-    if not REPORTLAB_AVAILABLE:
-        return Response(
-            {'error': 'PDF библиотека не установлена. Установите: pip install reportlab'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+@cached_report('expiring_memberships', ('membership', 'client', 'membershiptype'))
+async def expiring_memberships_report(request):
+    return await render_report(request, 'expiring_memberships')
 
-    try:
-        from .models import Membership
-
-        soon = date.today() + timedelta(days=7)
-        expiring = Membership.objects.filter(
-            end_date__lte=soon,
-            status='Активен'
-        ).select_related('client', 'type').order_by('end_date')
-
-        # Summary данные
-        summary_items = [
-            {'label': 'Критических абонементов', 'value': expiring.count()},
-            {'label': 'Период проверки', 'value': '7 дней'}
-        ]
-
-        # Подготовка данных для таблицы
-        headers = ['Клиент', 'Тип абонемента', 'Дата окончания', 'Осталось дней']
-        data_rows = []
-
-        for m in expiring:
-            days_left = (m.end_date - date.today()).days
-            # Цвет предупреждения
-            if days_left <= 0:
-                days_text = f"ИСТЁК"
-            elif days_left <= 3:
-                days_text = f"{days_left} (срочно!)"
-            else:
-                days_text = str(days_left)
-
-            data_rows.append([
-                f"{m.client.surname} {m.client.name}",
-                m.type.name,
-                m.end_date.strftime('%d.%m.%Y'),
-                days_text
-            ])
-
-        # Ширина колонок
-        col_widths = [5 * cm, 5 * cm, 3 * cm, 3 * cm]
-
-        # Генерация PDF
-        pdf = create_pdf_document(
-            title="ИСТЕКАЮЩИЕ АБОНЕМЕНТЫ",
-            subtitle=f"Дата формирования: {date.today().strftime('%d.%m.%Y')} • Проверка на {soon.strftime('%d.%m.%Y')}",
-            summary=summary_items,
-            headers=headers,
-            rows=data_rows,
-            col_widths=col_widths
-        )
 
-        return FileResponse(
-            pdf,
-            as_attachment=True,
-            filename='revenue_report.pdf',
-            content_type='application/pdf'
-        )
+def metrics_view(request):
+    """Метрики процесса в текстовом формате Prometheus"""
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return JsonResponse({'error': 'Неверный токен метрик'}, status=401)
+    else:
+        try:
+            jwt_authenticate(request)
+        except Exception as e:
+            return JsonResponse({'error': str(e)}, status=401)
 
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"Ошибка генерации PDF: {error_detail}")
-        return Response(
-            {'error': f'Ошибка генерации PDF: {str(e)}'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
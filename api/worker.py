@@ -0,0 +1,16 @@
+"""Инициализация процессов пула рендеринга (api.jobs.get_executor).
+
+Отдельный модуль без импорта моделей: spawn загружает initializer до
+django.setup(), а api.jobs импортирует модели на уровне модуля.
+"""
+import os
+
+import django
+from django.conf import settings
+
+
+def init_worker():
+    # Рендеринг уступает CPU веб-процессу, иначе на малом числе ядер растёт задержка API
+    if hasattr(os, 'nice'):
+        os.nice(settings.REPORT_JOBS_NICE)
+    django.setup()
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -87,9 +89,11 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
     'range',
+    'if-none-match',
+    'if-modified-since',
 ]
 
-CORS_EXPOSE_HEADERS = ['Content-Disposition', 'Content-Length', 'Content-Type']
+CORS_EXPOSE_HEADERS = ['Content-Disposition', 'Content-Length', 'Content-Type', 'X-Report-Cache', 'ETag', 'Last-Modified']
 
 CSRF_TRUSTED_ORIGINS = ["https://localhost:5173", "http://localhost:5173", "https://127.0.0.1:5173", "http://127.0.0.1:5173"]
 
@@ -116,18 +120,26 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # JWT
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
 }
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+CLIENT_IMPORT_BATCH_SIZE = 1000
+SCHEDULE_MAX_DAYS = 62  # самое длинное окно для расписания и поиска конфликтов
+# Сколько последних записей каждого раздела отдаёт карточка клиента (/api/clients/<id>/card/)
+CLIENT_CARD_LIMITS = {'memberships': 20, 'payments': 20, 'upcoming': 10, 'history': 20}
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 60  # секунд
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
@@ -142,6 +154,20 @@ DATABASES = {
     }
 }
 
+# Реплика только для чтения: на неё идут отчёты и GET-запросы API (api.db_router).
+# Без DB_REPLICA_HOST реплики нет и всё читается из default
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+DATABASE_REPLICA = os.getenv('DATABASE_REPLICA', 'replica')  # алиас реплики в DATABASES
+DATABASE_PRIMARY_PIN_SECONDS = 10  # после записи пользователь столько читает из default, пока реплика догоняет
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -199,6 +225,25 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 FONTS_DIR = BASE_DIR / 'static' / 'fonts' / 'dejavu-fonts-ttf-2.37' / 'ttf'
 
+# Reports
+REPORT_STREAM_CHUNK_SIZE = 2000  # строк за одну выборку курсора
+REPORT_TABLE_CHUNK_ROWS = 500  # строк в одной порции CSV
+REPORT_SPOOL_MAX_SIZE = 5 * 1024 * 1024  # больше этого PDF уходит во временный файл
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024  # объём LRU-кэша готовых отчётов на процесс
+REPORT_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024  # отчёты больше этого не кэшируются и отдаются потоком
+REPORT_JOBS_DIR = BASE_DIR / 'report_jobs'
+REPORT_JOBS_MAX_WORKERS = 2  # процессов рендеринга на один веб-процесс
+REPORT_JOBS_NICE = 10  # насколько понизить приоритет процессов рендеринга (os.nice)
+REPORT_JOBS_MAX_QUEUE = 20  # заданий этого веб-процесса в очереди и в работе одновременно
+REPORT_JOBS_TTL = timedelta(hours=24)  # после этого задание и файл удаляются
+REPORT_JOBS_TIMEOUT = timedelta(hours=1)  # незавершённое за это время задание считается failed
+REPORT_RENDER_MAX_PENDING = 8  # синхронных запросов отчётов в пуле на веб-процесс, сверх — 503
+
+# Metrics
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # если задан, /api/metrics/ принимает его вместо JWT
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '1.0'))  # порог записи в лог медленных запросов
+SLOW_REQUEST_TOP_QUERIES = 5  # самых долгих SQL в записи о медленном запросе
+
 # Logging
 LOGGING = {
     'version': 1,
@@ -218,5 +263,10 @@ LOGGING = {
             'level': os.getenv('DJANGO_LOG_LEVEL', 'INFO'),
             'propagate': False,
         },
+        'api': {
+            'handlers': ['console'],
+            'level': os.getenv('API_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
     },
 }
\ No newline at end of file
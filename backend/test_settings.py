@@ -0,0 +1,13 @@
+"""Настройки для прогона тестов на SQLite, без PostgreSQL:
+
+    python manage.py test --settings=backend.test_settings
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+    # Отдельная база без MIRROR, чтобы тесты api.db_router видели, откуда пришли данные
+    'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+}
+# Маршрутизацию на реплику включают только её тесты (override_settings)
+DATABASE_REPLICA = ''